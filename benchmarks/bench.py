@@ -0,0 +1,189 @@
+"""Benchmarks for parsing, layout loading, lookup, decoding and rendering.
+
+Run them from the repository root:
+
+    $ python benchmarks/bench.py --output before.json
+    $ python benchmarks/bench.py --compare before.json
+
+Each stage reports its throughput and the peak memory allocated while
+it runs. The hex dump covers every instance of the layout with random
+register contents and is repeated --scale times. --synthetic replaces
+the layout with a large generated one, see synthetic.py.
+"""
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import click
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from regulator.decode import Decoder  # noqa: E402
+from regulator.memory import MemoryView  # noqa: E402
+from regulator.output import NullSink  # noqa: E402
+from regulator.parse import Parser  # noqa: E402
+from synthetic import dump_layout  # noqa: E402
+from synthetic import make_layout  # noqa: E402
+
+
+def make_dump(decoder, *, scale=1, seed=0):
+    """hex dump lines covering every instance of the layout, scale times"""
+    rng = random.Random(seed)
+    lines = []
+    for _ in range(scale):
+        for instance in decoder._ordered:
+            loc = instance.location
+            for addr in range(loc.start, loc.stop, 16):
+                words = ['{:08x}'.format(rng.getrandbits(32)) for _ in range(min(4, (loc.stop-addr)//4))]
+                lines.append('{:08x}: {} {}'.format(addr, ' '.join(words), '.'*16))
+    return lines
+
+def parse(lines):
+    parser = Parser(coalesce=True, sink=NullSink())
+    return parser.parse_lines(lines) + parser.flush()
+
+def registers(decoder, slices):
+    """(view, type) for every register in the slices"""
+    result = []
+    for ms in slices:
+        for region in ms.regions():
+            for instance in decoder.find_instances(region):
+                cluster = decoder.clusters[instance.cluster]
+                mv = MemoryView(ms, instance.location & region)
+                loc = mv.outer_loc - instance.location.start
+                for reg, reg_type in cluster.iterate(loc):
+                    result.append((MemoryView(mv, reg.location - loc.start), reg_type))
+    return result
+
+def measure(func, *, min_time):
+    """run func until min_time passed, return (items, best seconds, peak bytes)"""
+    best = None
+    total = 0
+    while total < min_time or best is None:
+        start = time.perf_counter()
+        items = func()
+        elapsed = time.perf_counter()-start
+        total += elapsed
+        best = elapsed if best is None else min(best, elapsed)
+    # a separate run, tracing allocations distorts the timing
+    tracemalloc.start()
+    try:
+        func()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return items, best, peak
+
+def stages(layout, scale):
+    """yield (name, unit, func) for every benchmarked stage"""
+    decoder = Decoder(layout, sink=NullSink())
+    lines = make_dump(decoder, scale=scale)
+    slices = parse(lines)
+    regs = registers(decoder, slices)
+    reg_count = sum(len(decoder.clusters[name].registers) for name in decoder.clusters)
+
+    yield 'parse', 'lines', lambda: len(parse(lines)) and len(lines)
+
+    yield 'load', 'registers', lambda: Decoder(layout, sink=NullSink()) and reg_count
+
+    cache_home = tempfile.mkdtemp()
+    os.environ['XDG_CACHE_HOME'] = cache_home
+    try:
+        Decoder(layout, cache=True, sink=NullSink())
+        yield 'load-cached', 'registers', lambda: Decoder(layout, cache=True, sink=NullSink()) and reg_count
+    finally:
+        shutil.rmtree(cache_home)
+
+    def lookup():
+        for mv, reg_type in regs:
+            decoder.find_cluster(mv.map(0))
+        return len(regs)
+    yield 'lookup', 'registers', lookup
+
+    def decode_fields():
+        for mv, reg_type in regs:
+            decoder.decode_fields(mv, reg_type)
+        return len(regs)
+    yield 'decode-fields', 'registers', decode_fields
+
+    def dump():
+        for mv, reg_type in regs:
+            mv.dump()
+        return len(regs)
+    yield 'dump', 'registers', dump
+
+    cold = Decoder(layout, sink=NullSink(), memo_size=0)
+    def render():
+        for ms in slices:
+            cold.decode(ms)
+        return len(regs)
+    yield 'render', 'registers', render
+
+    def render_memo():
+        for ms in slices:
+            decoder.decode(ms)
+        return len(regs)
+    yield 'render-memo', 'registers', render_memo
+
+@click.command()
+@click.option('--layout', type=click.Path(exists=True), default='layouts/imx28.yaml',
+              help='The layout to benchmark with.')
+@click.option('--synthetic', is_flag=True,
+              help='Benchmark with a generated layout of 50 clusters and 200 instances instead.')
+@click.option('--scale', type=click.IntRange(1), default=100,
+              help='How often the generated dump covers the layout.')
+@click.option('--min-time', type=float, default=0.5,
+              help='Repeat each stage for at least this many seconds.')
+@click.option('--output', type=click.Path(), help='Save the results as JSON.')
+@click.option('--compare', type=click.File('r'), help='Show the change relative to saved results.')
+def main(layout, synthetic, scale, min_time, output, compare):
+    if synthetic:
+        fd, layout = tempfile.mkstemp(suffix='.yaml')
+        with os.fdopen(fd, 'w') as f:
+            dump_layout(make_layout(clusters=50, registers=64, instances=200), f)
+    try:
+        run(layout, 'synthetic' if synthetic else layout, scale, min_time, output, compare)
+    finally:
+        if synthetic:
+            os.unlink(layout)
+
+def run(layout, layout_name, scale, min_time, output, compare):
+    results = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'layout': layout_name,
+        'scale': scale,
+        'stages': {},
+    }
+    baseline = json.load(compare)['stages'] if compare else {}
+
+    print('{:<14} {:>9} {:>12} {:>10} {:>11}'.format('stage', 'items', 'rate', 'unit/s', 'peak KiB'))
+    for name, unit, func in stages(layout, scale):
+        items, seconds, peak = measure(func, min_time=min_time)
+        rate = items/seconds
+        results['stages'][name] = {
+            'items': items,
+            'unit': unit,
+            'seconds': seconds,
+            'rate': rate,
+            'peak_bytes': peak,
+        }
+        line = '{:<14} {:>9} {:>12.0f} {:>10} {:>11.1f}'.format(name, items, rate, unit, peak/1024)
+        if name in baseline:
+            line += ' {:+7.1%}'.format(rate/baseline[name]['rate']-1)
+        print(line)
+
+    if output:
+        with open(output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+            f.write('\n')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+"""Generate large synthetic layouts and matching hex dumps.
+
+    $ python benchmarks/synthetic.py --clusters 200 --registers 64 --instances 1000 \\
+          --layout big.yaml --dump big.txt --lines 1000000
+    $ regulator input big.yaml < big.txt
+
+Dumps come in two styles: 'md' writes absolute addresses like u-boot's
+md command, 'memtool' starts with a mapping header and writes offsets
+relative to it, like memedit.
+"""
+import random
+
+import click
+import yaml
+
+STYLES = ('md', 'memtool')
+
+
+def split_word(rng, fields, bits=32):
+    """cut a word into at most fields (start, stop) bit ranges, leaving some gaps"""
+    cuts = sorted(rng.sample(range(1, bits), min(fields, bits)-1))
+    ranges = []
+    for start, stop in zip([0] + cuts, cuts + [bits]):
+        # an occasional reserved gap at the top of a field
+        if stop-start > 1 and rng.random() < 0.1:
+            stop -= 1
+        ranges.append((start, stop))
+    return ranges
+
+def make_type(rng, name, *, fields, enums, enum_values):
+    config = {}
+    for i, (start, stop) in enumerate(split_word(rng, fields)):
+        width = stop-start
+        if width == 1:
+            key = 'u1 {}'.format(start)
+        else:
+            key = 'u{} {}…{}'.format(width, start, stop-1)
+        field_name = '{}_F{}'.format(name, i)
+        # enums have to cover every value the field can take
+        if (1 << width) <= enum_values and rng.random() < enums:
+            config[key] = {
+                'name': field_name,
+                'enum': {v: '{} value {}'.format(field_name, v) for v in range(1 << width)},
+            }
+        else:
+            config[key] = field_name
+    return {'fields': config}
+
+def make_layout(*, clusters=10, registers=32, fields=12, enums=0.25, enum_values=16,
+                instances=100, density=0.5, base=0x40000000, seed=0):
+    """a layout as a dict, ready to be dumped as YAML
+
+    density is the fraction of the address space between the first and
+    the last instance which is covered by instances.
+    """
+    rng = random.Random(seed)
+    layout = {'clusters': {}, 'instances': {}}
+    for c in range(clusters):
+        cluster_name = 'C{}'.format(c)
+        types = {}
+        regs = {}
+        for r in range(registers):
+            name = '{}_R{}'.format(cluster_name, r)
+            types['r32 {}'.format(name)] = make_type(
+                    rng, name, fields=fields, enums=enums, enum_values=enum_values)
+            regs['r32 0x{:x}'.format(r*4)] = name
+        layout['clusters'][cluster_name] = {
+            'size': (registers*4+15)//16*16,
+            'types': types,
+            'registers': regs,
+        }
+    size = (registers*4+15)//16*16
+    spacing = max(size, int(size/density+15)//16*16)
+    for i in range(instances):
+        cluster_name = 'C{}'.format(i % clusters)
+        layout['instances']['{} 0x{:x}'.format(cluster_name, base+i*spacing)] = 'I{}'.format(i)
+    return layout
+
+def dump_layout(layout, stream):
+    yaml.safe_dump(layout, stream, allow_unicode=True, default_flow_style=False)
+
+def _ascii(words):
+    data = b''.join(w.to_bytes(4, 'little') for w in words)
+    return ''.join(chr(b) if 0x20 < b < 0x7f else '.' for b in data).ljust(16, '.')
+
+def make_dump(layout, *, lines, style='md', seed=0):
+    """yield hex dump lines covering the instances of a layout, repeating them
+    with new contents until there are enough lines"""
+    assert style in STYLES
+    rng = random.Random(seed)
+    ranges = []
+    for key in layout['instances']:
+        cluster_name, start = key.split(' ', 1)
+        start = int(start, 0)
+        ranges.append((start, start+layout['clusters'][cluster_name]['size']))
+    ranges.sort()
+    map_base = 0
+    if style == 'memtool':
+        map_base = ranges[0][0] & ~0xfffff
+        map_size = ranges[-1][1] - map_base
+        yield '->map 0x{:x} 0x{:x}'.format(map_base, map_size)
+        yield 'mapping offset 0x{:08x} (size 0x{:x})'.format(map_base, map_size)
+        yield '->md 0x0 0x{:x}'.format(map_size)
+        lines -= 3
+
+    while lines > 0:
+        for start, stop in ranges:
+            for addr in range(start, stop, 16):
+                words = [rng.getrandbits(32) for _ in range(min(4, (stop-addr)//4))]
+                yield '{:08x}: {}    {}'.format(
+                        addr-map_base, ' '.join('{:08x}'.format(w) for w in words), _ascii(words))
+                lines -= 1
+                if not lines:
+                    return
+
+@click.command()
+@click.option('--clusters', type=click.IntRange(1), default=10, help='Number of clusters.')
+@click.option('--registers', type=click.IntRange(1), default=32, help='Registers per cluster.')
+@click.option('--fields', type=click.IntRange(1, 32), default=12, help='Fields per register.')
+@click.option('--enums', type=click.FloatRange(0, 1), default=0.25,
+              help='Fraction of the narrow enough fields which get an enum.')
+@click.option('--enum-values', type=click.IntRange(2), default=16,
+              help='Only fields with at most this many values get an enum.')
+@click.option('--instances', type=click.IntRange(1), default=100, help='Number of instances.')
+@click.option('--density', type=click.FloatRange(0.01, 1), default=0.5,
+              help='Fraction of the address range covered by instances.')
+@click.option('--seed', type=int, default=0)
+@click.option('--layout', 'layout_file', type=click.File('w'), required=True,
+              help='Write the layout here.')
+@click.option('--dump', 'dump_file', type=click.File('w'), help='Write a matching dump here.')
+@click.option('--lines', type=click.IntRange(4), default=10000, help='Lines in the dump.')
+@click.option('--style', type=click.Choice(STYLES), default='md', help='Dump style.')
+def main(clusters, registers, fields, enums, enum_values, instances, density, seed,
+         layout_file, dump_file, lines, style):
+    layout = make_layout(
+            clusters=clusters, registers=registers, fields=fields, enums=enums,
+            enum_values=enum_values, instances=instances, density=density, seed=seed)
+    dump_layout(layout, layout_file)
+    if dump_file is not None:
+        for line in make_dump(layout, lines=lines, style=style, seed=seed):
+            dump_file.write(line+'\n')
+
+if __name__ == '__main__':
+    main()
@@ -17,16 +17,18 @@ setup(
         'setuptools_scm',
     ],
     tests_require=[
+        'bitstruct',
         'hypothesis',
+        'prettyprinter',
     ],
     install_requires=[
         'attrs',
-        'bitstruct',
         'click',
-        'prettyprinter',
         'pyyaml',
-        'sortedcontainers',
     ],
+    extras_require={
+        'gui': ['pygobject'],
+    },
     packages=find_packages('src'),
     package_dir={'': 'src'},
     entry_points={
@@ -1,158 +1,296 @@
+import atexit
+import mmap
 import os
 import signal
+import stat
 import sys
+import time
+import traceback
+from datetime import datetime
 
 import click
-import gi
 
-from . import decode, parse
+from . import decode, formats, memory, output, parse, stats
 
-gi.require_version('Gdk', '3.0') # isort:skip
-gi.require_version('Gtk', '3.0') # isort:skip
-from gi.repository import Gdk, Gio, Gtk # isort:skip
+# the GTK based selection command imports .gui on demand, so that the
+# other commands neither pay for GObject introspection nor need the Gtk
+# typelibs, the modules only needed by one command are imported there
 
+DUMP_FORMATS = ['auto'] + [f.name for f in formats.FORMATS]
 
-class DecoderMonitor:
-    def __init__(self, filename):
-        self.filename = filename
-        self.file = Gio.File.new_for_path(filename)
-        self.monitor = self.file.monitor_file(
-                Gio.FileMonitorFlags.NONE,
-                None)
-        self.monitor.connect('changed', self.on_change)
-        print('monitoring layout {}'.format(filename))
-        self.decoder = decode.Decoder(filename)
-        print('decoder loaded')
-
-    def reload(self):
-        self.decoder.reload()
-        print('decoder reloaded')
-
-    def on_change(self, file_monitor, file, other_file, event_type):
-        if event_type == Gio.FileMonitorEvent.CREATED:
-            pass
-        elif event_type == Gio.FileMonitorEvent.DELETED:
-            pass
-        elif event_type == Gio.FileMonitorEvent.CHANGED:
-            pass
-        elif event_type == Gio.FileMonitorEvent.CHANGES_DONE_HINT:
-            self.reload()
-        elif event_type == Gio.FileMonitorEvent.ATTRIBUTE_CHANGED:
-            pass
-        else:
-            print(self, event_type)
-
-class ClipboardHandler:
-    def __init__(self, decoder):
-        self.decoder = decoder
-        self.parser = parse.Parser()
-        print('parser started')
-        self.clipboard = Gtk.Clipboard.get(Gdk.SELECTION_PRIMARY,)
-        self.clipboard.connect('owner-change', self.on_change)
-        print('monitoring primary selection')
-
-    def on_change(self, clipboard, _):
-        text = clipboard.wait_for_text()
-        if text is None:
-            return
-        for ms in self.parser.parse_dirty(text):
-            self.decoder.decode(ms)
-        print('selection done')
-
-class LogHandler:
-    def __init__(self, decoder, filename):
-        self.decoder = decoder
-        self.filename = filename
-        self.parser = parse.Parser()
-        print('parser started')
-        self.file = Gio.File.new_for_path(filename)
-        self.monitor = self.file.monitor_file(
-                Gio.FileMonitorFlags.NONE,
-                None)
-        self.monitor.connect('changed', self.on_change)
-        print('monitoring file {}'.format(filename))
-        self.open()
-
-    def open(self):
-        try:
-            self.reader = open(self.filename, 'r')
-            self.reader.seek(0, os.SEEK_END)
-            self.offset = self.reader.tell()
-            self.buffer = ''
-            print('opened file {}'.format(self.filename))
-        except FileNotFoundError:
-            self.reader = None
-
-    def close(self):
-        try:
-            self.reader.close()
-            print('closed file {}'.format(self.filename))
-        finally:
-            self.reader = None
-
-    def read(self):
-        self.reader.seek(0, os.SEEK_END)
-        if self.offset > self.reader.tell():
-            self.close()
-            self.open()
-        else:
-            self.reader.seek(self.offset)
-        while True:
-            chunk = self.reader.read(4096)
-            if not chunk:
-                break
-            self.buffer += chunk
-        self.offset = self.reader.tell()
-        lines = self.buffer.split('\n')
-        self.buffer = lines.pop()
-        if not lines:
-            return
-        for ms in self.parser.parse_lines(lines):
-            self.decoder.decode(ms)
-
-    def on_change(self, file_monitor, file, other_file, event_type):
-        if event_type == Gio.FileMonitorEvent.CREATED:
-            self.open()
-        elif event_type == Gio.FileMonitorEvent.DELETED:
-            self.close()
-        elif event_type == Gio.FileMonitorEvent.CHANGED:
-            if self.reader:
-                self.read()
-        elif event_type == Gio.FileMonitorEvent.CHANGES_DONE_HINT:
-            print('log done')
-        else:
-            print(self, event_type)
 
 @click.group()
 def cli():
     pass
 
+def _collect_stats(enabled, *, on_signal=False):
+    """a Stats instance reported at exit (and on SIGUSR1), or None"""
+    if not enabled:
+        return None
+    collected = stats.Stats()
+    atexit.register(collected.report)
+    if on_signal:
+        signal.signal(signal.SIGUSR1, lambda signum, frame: collected.report())
+    return collected
+
+def _exit_on_interrupt(collected):
+    """exit right away on Ctrl-C, after reporting the stats if they are collected"""
+    if collected is None:
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        return
+    def interrupted(signum, frame):
+        collected.report()
+        sys.stdout.flush()
+        os._exit(128+signum)
+    signal.signal(signal.SIGINT, interrupted)
+
 @cli.command()
 @click.argument('layout', type=click.Path())
-def selection(layout):
-    decoder_monitor = DecoderMonitor(layout)
-    handler = ClipboardHandler(decoder_monitor.decoder)
-    signal.signal(signal.SIGINT, signal.SIG_DFL)
-    Gtk.main()
+@click.option('--stats', is_flag=True,
+              help='Print decode statistics to stderr on SIGUSR1 and at exit, also on Ctrl-C.')
+def selection(layout, stats):
+    from . import gui
+    stats = _collect_stats(stats, on_signal=True)
+    decoder_monitor = gui.DecoderMonitor(layout, stats=stats)
+    handler = gui.ClipboardHandler(decoder_monitor.decoder, stats=stats)
+    _exit_on_interrupt(stats)
+    gui.main()
+
+def _dump_format(name):
+    return None if name == 'auto' else name
+
+def _mtime(filename):
+    try:
+        return os.stat(filename).st_mtime_ns
+    except FileNotFoundError:
+        return None
 
 @cli.command()
 @click.argument('layout', type=click.Path())
 @click.argument('log', type=click.Path())
-def log(layout, log):
-    decoder_monitor = DecoderMonitor(layout)
-    handler = LogHandler(decoder_monitor.decoder, log)
-    signal.signal(signal.SIGINT, signal.SIG_DFL)
-    Gtk.main()
+@click.option('--dump-format', type=click.Choice(DUMP_FORMATS),
+              default='auto', help='Format of the hex dump, detected from the first lines by default.')
+@click.option('--store', type=click.Path(file_okay=False),
+              help='Also record the register values in this history store.')
+@click.option('--stats', is_flag=True,
+              help='Print decode statistics to stderr on SIGUSR1 and at exit, also on Ctrl-C.')
+def log(layout, log, dump_format, store, stats):
+    from . import tail
+    stats = _collect_stats(stats, on_signal=True)
+    sink = output.BufferedSink(sys.stdout)
+    # compile all clusters on each load, so that a broken layout edit is
+    # reported on reload and the previous layout is kept
+    decoder = decode.Decoder(layout, sink=sink, stats=stats)
+    layout_mtime = _mtime(layout)
+    print('decoder loaded')
+    parser = parse.Parser(coalesce=True, sink=sink, stats=stats, format=_dump_format(dump_format))
+    tailer = tail.Tailer(log)
+    if store is not None:
+        from . import history
+        store = history.Store(store)
+    print('monitoring file {}'.format(log))
+    _exit_on_interrupt(stats)
+    for lines in tailer.follow():
+        mtime = _mtime(layout)
+        if mtime != layout_mtime:
+            layout_mtime = mtime
+            try:
+                decoder.reload()
+                print('decoder reloaded')
+            except Exception:
+                traceback.print_exc()
+        if not lines:
+            continue
+        timestamp = time.time()
+        for ms in parser.parse_lines(lines) + parser.flush():
+            decoder.decode(ms)
+            if store is not None:
+                store.record(decoder, ms, timestamp)
+        sink.flush()
+        if store is not None:
+            store.flush()
 
 @cli.command()
 @click.argument('layout', type=click.Path())
-def input(layout):
-    parser = parse.Parser()
-    decoder = decode.Decoder(layout)
+@click.option('--cache/--no-cache', default=True,
+              help='Use the compiled layout cache.')
+@click.option('--format', type=click.Choice(sorted(output.EMITTERS)), default='text',
+              help='Output format.')
+@click.option('--jobs', '-j', type=click.IntRange(1), default=1,
+              help='Decode in a pool of this many worker processes.')
+@click.option('--socket', 'socket_path', type=click.Path(), envvar='REGULATOR_SOCKET',
+              help='Let the decode server listening on this socket do the work, if it runs.')
+@click.option('--dump-format', type=click.Choice(DUMP_FORMATS),
+              default='auto', help='Format of the hex dump, detected from the first lines by default.')
+@click.option('--stats', is_flag=True,
+              help='Print decode statistics to stderr at exit.')
+def input(layout, cache, format, jobs, socket_path, dump_format, stats):
+    if socket_path and jobs > 1:
+        sys.stderr.write("Note: not using the decode server at '{}' with --jobs\n".format(
+            socket_path))
+    elif socket_path:
+        from . import serve
+        sock = serve.connect(socket_path)
+        if sock is not None:
+            try:
+                serve.request(sock, layout, sys.stdin.buffer, sys.stdout.buffer, format=format,
+                              dump_format=_dump_format(dump_format))
+            except serve.ServeError as e:
+                raise click.ClickException('decode server: {}'.format(e))
+            finally:
+                sys.stdout.buffer.flush()
+            return
+
+    stats = _collect_stats(stats)
+    sink = output.BufferedSink(sys.stdout)
+    if format == 'text':
+        parser = parse.Parser(coalesce=True, sink=sink, stats=stats, format=_dump_format(dump_format))
+    else:
+        # keep parser messages out of machine readable output
+        parser = parse.Parser(coalesce=True, sink=output.PrintSink(sys.stderr), stats=stats,
+                              format=_dump_format(dump_format))
+    decoder = decode.Decoder(layout, cache=cache, lazy=True, sink=sink, format=format, stats=stats)
 
-    for line in sys.stdin:
-        for ms in parser.parse_lines((line, )):
+    try:
+        if jobs > 1:
+            from . import parallel
+            slices = []
+            for lines in parse.read_blocks(sys.stdin):
+                slices.extend(parser.parse_lines(lines))
+            slices.extend(parser.flush())
+            parallel.decode(decoder, slices, jobs=jobs, format=format, cache=cache, sink=sink)
+            return
+        # decode piped input as it arrives, e.g. from tail -f
+        streaming = not stat.S_ISREG(os.fstat(sys.stdin.fileno()).st_mode)
+        for lines in parse.read_blocks(sys.stdin):
+            for ms in parser.parse_lines(lines):
+                decoder.decode(ms)
+            if streaming:
+                for ms in parser.flush():
+                    decoder.decode(ms)
+                sink.flush()
+        for ms in parser.flush():
             decoder.decode(ms)
+    finally:
+        sink.flush()
+
+@cli.command('diff')
+@click.argument('layout', type=click.Path())
+@click.argument('old', type=click.File('r'))
+@click.argument('new', type=click.File('r'))
+@click.option('--cache/--no-cache', default=True,
+              help='Use the compiled layout cache.')
+def diff_dumps(layout, old, new, cache):
+    """Show the registers and fields which differ between two dumps."""
+    from . import diff
+    sink = output.BufferedSink(sys.stdout)
+    decoder = decode.Decoder(layout, cache=cache, lazy=True, sink=sink)
+    a = diff.load(old)
+    b = diff.load(new)
+    if a is None or b is None:
+        raise click.ClickException('no memory contents found in dump')
+    try:
+        diff.render(diff.changes(decoder, a, b), sink)
+    finally:
+        sink.flush()
+
+def _address(ctx, param, value):
+    try:
+        return int(value, 0)
+    except ValueError:
+        raise click.BadParameter('{!r} is not an address'.format(value))
+
+@cli.command()
+@click.argument('layout', type=click.Path())
+@click.argument('image', type=click.Path(exists=True, dir_okay=False))
+@click.option('--base', default='0', callback=_address,
+              help='The address of the first byte in the image.')
+@click.option('--word-size', type=click.Choice(['1', '2', '4', '8']), default='4',
+              help='The word size in bytes.')
+@click.option('--big-endian', is_flag=True,
+              help='The words in the image are big endian.')
+@click.option('--cache/--no-cache', default=True,
+              help='Use the compiled layout cache.')
+@click.option('--format', type=click.Choice(sorted(output.EMITTERS)), default='text',
+              help='Output format.')
+@click.option('--stats', is_flag=True,
+              help='Print decode statistics to stderr at exit.')
+def image(layout, image, base, word_size, big_endian, cache, format, stats):
+    """Decode a raw binary memory image."""
+    stats = _collect_stats(stats)
+    sink = output.BufferedSink(sys.stdout)
+    decoder = decode.Decoder(layout, cache=cache, lazy=True, sink=sink, format=format, stats=stats)
+    with open(image, 'rb') as f:
+        if not os.fstat(f.fileno()).st_size:
+            return
+        # only the pages covered by instances are ever read from the file
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            ms = memory.MemorySlice.from_buffer(
+                    base, buffer, swapped=not big_endian, word_size=int(word_size))
+            try:
+                decoder.decode(ms)
+            finally:
+                sink.flush()
+                ms.image.release()
+
+def _timestamp(ctx, param, value):
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    for fmt in ('%Y-%m-%d %H:%M:%S.%f', '%Y-%m-%d %H:%M:%S', '%Y-%m-%dT%H:%M:%S.%f',
+                '%Y-%m-%dT%H:%M:%S', '%Y-%m-%d'):
+        try:
+            return datetime.strptime(value, fmt).timestamp()
+        except ValueError:
+            pass
+    raise click.BadParameter('{!r} is neither a date nor seconds since the epoch'.format(value))
+
+@cli.command('history')
+@click.argument('layout', type=click.Path())
+@click.argument('store', type=click.Path(exists=True, file_okay=False))
+@click.argument('name')
+@click.option('--since', callback=_timestamp,
+              help='Only show samples from this local time or epoch seconds on.')
+@click.option('--until', callback=_timestamp,
+              help='Only show samples up to this local time or epoch seconds.')
+@click.option('--changes', is_flag=True,
+              help='Only show samples where the value changed.')
+@click.option('--cache/--no-cache', default=True,
+              help='Use the compiled layout cache.')
+def show_history(layout, store, name, since, until, changes, cache):
+    """Show the recorded values of [INSTANCE.]REGISTER[.FIELD] over time."""
+    from . import history
+    sink = output.BufferedSink(sys.stdout)
+    decoder = decode.Decoder(layout, cache=cache, lazy=True, sink=sink)
+    matches = history.resolve(decoder, name)
+    if not matches:
+        raise click.ClickException('no register or field {!r} in the layout'.format(name))
+    if len(matches) > 1:
+        raise click.ClickException('{!r} is ambiguous, use one of: {}'.format(name, ', '.join(
+            sorted('{}.{}'.format(instance.name, name) for instance, _, _, _ in matches))))
+    instance, reg, reg_type, field = matches[0]
+    store = history.Store(store)
+    samples = history.history(
+            store, instance, reg, reg_type, field, since=since, until=until, changes=changes)
+    try:
+        history.render(samples, instance, reg, field, sink)
+    finally:
+        sink.flush()
+
+@cli.command()
+@click.argument('layouts', nargs=-1, type=click.Path(exists=True))
+@click.option('--socket', 'socket_path', type=click.Path(), required=True,
+              help='The Unix socket to listen on.')
+@click.option('--cache/--no-cache', default=True,
+              help='Use the compiled layout cache.')
+def serve(layouts, socket_path, cache):
+    """Keep layouts loaded and decode dumps sent over a Unix socket."""
+    from . import serve
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    serve.Server(layouts, cache=cache).run(socket_path)
 
 if __name__=="__main__":
     cli()
@@ -0,0 +1,44 @@
+import hashlib
+import os
+import pickle
+import sys
+
+# bump whenever the compiled layout classes change incompatibly
+FORMAT_VERSION = 4
+
+
+def cache_dir():
+    base = os.environ.get('XDG_CACHE_HOME')
+    if not base:
+        base = os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'regulator')
+
+def cache_path(content):
+    digest = hashlib.sha256(content).hexdigest()
+    return os.path.join(cache_dir(), 'layout-v{}-{}.pickle'.format(FORMAT_VERSION, digest))
+
+def load(content):
+    """return the compiled state stored for the layout content, if any"""
+    try:
+        with open(cache_path(content), 'rb') as f:
+            return pickle.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        sys.stderr.write("Note: ignoring broken layout cache: {}\n".format(e))
+        return None
+
+def store(content, state):
+    path = cache_path(content)
+    tmp = '{}.{}.tmp'.format(path, os.getpid())
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(tmp, 'wb') as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+    except OSError as e:
+        sys.stderr.write("Note: could not write layout cache: {}\n".format(e))
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
@@ -1,24 +1,60 @@
 import attr
-import bitstruct
 import sys
+import time
+import weakref
 import yaml
-from prettyprinter import pprint
-from sortedcontainers import SortedListWithKey
+from collections.abc import Mapping
+from operator import attrgetter
 
+from . import cache
 from .location import Location
+from .location import LocationIndex
+from .lru import LRUCache
 from .memory import MemoryView
-
-
-@attr.s
+from .memory import bits_template
+from .output import EMITTERS
+from .output import PrintSink
+from .records import DecodedWord
+from .records import FieldRecord
+from .records import RegisterRecord
+from .records import UnmatchedRecord
+
+# prefer the libyaml based loader, it is several times faster
+YAMLLoader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+# Kinds and enums are shared by all fields and registers using them,
+# even across layouts, so that big layouts stay small in memory. They
+# are forgotten once no loaded layout uses them any more.
+_KINDS = weakref.WeakValueDictionary()
+_ENUMS = weakref.WeakValueDictionary()
+
+
+class Enum(dict):
+    """an interned enum, a dict which can be weakly referenced"""
+    __slots__ = ('__weakref__', )
+
+def intern_enum(enum):
+    """return a shared dict equal to enum"""
+    try:
+        key = frozenset(enum.items())
+    except TypeError:
+        return enum
+    shared = _ENUMS.get(key)
+    if shared is None:
+        shared = _ENUMS[key] = Enum(enum)
+    return shared
+
+@attr.s(slots=True, frozen=True)
 class Kind:
     hint = attr.ib()
     bits = attr.ib()
 
     @classmethod
     def from_str(cls, s):
-        hint = s[0:1]
-        bits = int(s[1:])
-        return cls(hint, bits)
+        kind = _KINDS.get(s)
+        if kind is None:
+            kind = _KINDS[s] = cls(s[0:1], int(s[1:]))
+        return kind
 
     def __attrs_post_init__(self):
         if not self.hint in ['r', 'u']:
@@ -31,7 +67,7 @@ class Kind:
     def __str__(self):
         return self.hint+str(self.bits)
 
-@attr.s
+@attr.s(slots=True)
 class Field:
     name = attr.ib()
     kind = attr.ib()
@@ -41,21 +77,29 @@ class Field:
     def __attrs_post_init__(self):
         self.kind = Kind.from_str(self.kind)
         self.location = Location.from_str(self.location, size=self.kind.bits)
+        if self.enum is not None:
+            self.enum = intern_enum(self.enum)
+
+    @property
+    def mask(self):
+        return (1 << self.kind.bits) - 1
 
     def decode(self, value):
         if self.enum is not None:
             return self.enum[value]
 
-@attr.s
+@attr.s(slots=True)
 class Type:
     name = attr.ib()
     kind = attr.ib()
     fields = attr.ib()
     enums = attr.ib(default=None)
+    _index = attr.ib(init=False, repr=False, cmp=False)
+    plan = attr.ib(init=False, repr=False, cmp=False)
 
     def __attrs_post_init__(self):
         self.kind = Kind.from_str(self.kind)
-        fields = SortedListWithKey(key=lambda x: x.location)
+        fields = []
         for k, v in self.fields.items():
             try:
                 kind, location = k.split()
@@ -63,28 +107,50 @@ class Type:
                     name = v
                     config = {}
                 else:
-                    name = v.pop('name')
-                    config = v
+                    # don't modify the layout, so that a failed compile can be retried
+                    config = dict(v)
+                    name = config.pop('name')
                 if "enum" in config.keys() and isinstance(config["enum"], str):
                     assert config["enum"] in self.enums.keys()
                     config["enum"] = self.enums[config["enum"]]
                 field = Field(name, kind, location, **config)
-                fields.add(field)
+                if field.enum is not None and isinstance(v["enum"], dict):
+                    # let the layout share the interned enum as well
+                    v["enum"] = field.enum
+                fields.append(field)
             except:
                 sys.stderr.write("Note: in field '{}':\n".format(k))
                 raise
-        self.fields = fields
+        self.fields = tuple(sorted(fields, key=attrgetter('location')))
+        self._index = LocationIndex(
+                (field.location for field in self.fields),
+                overlap=True)
+        self.plan = self.compile()
 
     def __len__(self):
         return len(self.kind)
 
+    def compile(self):
+        """flatten the fields into (location, name, shift, mask, enum, template) entries"""
+        plan = []
+        for field in reversed(self.fields):
+            plan.append((
+                field.location,
+                field.name,
+                field.location.start,
+                field.mask,
+                field.enum,
+                # prepare the rendering, so that it only has to fill in the word
+                bits_template(field.location, len(self.kind)),
+            ))
+        return tuple(plan)
+
     def find_field(self, addr):
-        addr = Location(addr)
-        for field in self.fields:
-            if field.location & addr:
-                return field
+        idx = self._index.find(addr)
+        if idx is not None:
+            return self.fields[idx]
 
-@attr.s
+@attr.s(slots=True)
 class Register:
     name = attr.ib()
     kind = attr.ib()
@@ -98,13 +164,14 @@ class Register:
         if self.type_name is None:
             self.type_name = self.name
 
-@attr.s
+@attr.s(slots=True)
 class Cluster:
     name = attr.ib()
     size = attr.ib()
     types = attr.ib()
     registers = attr.ib()
     word_size = attr.ib(default=4)
+    _index = attr.ib(init=False, repr=False, cmp=False)
 
     def __attrs_post_init__(self):
         types = {}
@@ -118,7 +185,7 @@ class Cluster:
                 raise
         self.types = types
 
-        registers = SortedListWithKey(key=lambda x: x.location)
+        registers = []
         for k, v in self.registers.items():
             try:
                 kind, location = k.split(' ', 1)
@@ -126,45 +193,103 @@ class Cluster:
                     name = v
                     config = {}
                 else:
-                    name = v.pop('name')
-                    config = v
+                    config = dict(v)
+                    name = config.pop('name')
                 assert name in self.types.keys()
                 register = Register(name, kind, location, config.get('type'))
-                registers.add(register)
+                registers.append(register)
             except:
                 sys.stderr.write("Note: in register '{}':\n".format(k))
                 raise
-        self.registers = registers
+        self.registers = tuple(sorted(registers, key=attrgetter('location')))
+        # registers may overlap, the first one in order wins as for fields
+        self._index = LocationIndex(
+                (register.location for register in self.registers),
+                overlap=True)
 
     @property
     def inner_loc(self):
         return Location.from_size(self.size)
 
     def find_register(self, addr):
-        addr = Location(addr)
-        for register in self.registers:
-            if register.location & addr:
-                return register
+        idx = self._index.find(addr)
+        if idx is not None:
+            return self.registers[idx]
+
+    def find_registers(self, start, stop):
+        """indices into registers of all registers overlapping start…stop-1"""
+        return self._index.overlapping(start, stop)
 
     def find_type(self, addr):
         register = self.find_register(addr)
         return self.types[register.type_name]
 
     def iterate(self, loc):
-        for register in self.registers.irange_key(
-                min_key=Location(loc.start),
-                max_key=Location(loc.stop),
-                inclusive=(True, False)):
+        registers = self.registers
+        for idx in self._index.starting(loc.start, loc.stop):
+            register = registers[idx]
             yield (register, self.types[register.type_name])
 
-@attr.s
+class Clusters(Mapping):
+    """the cluster configs of a layout, compiled on first access"""
+
+    def __init__(self, configs):
+        self._configs = configs
+        self._compiled = {}
+
+    def __getitem__(self, name):
+        cluster = self._compiled.get(name)
+        if cluster is not None:
+            return cluster
+        config = self._configs[name]
+        try:
+            cluster = Cluster(name, **config)
+        except:
+            sys.stderr.write("Note: in cluster '{}':\n".format(name))
+            raise
+        self._compiled[name] = cluster
+        return cluster
+
+    def __contains__(self, name):
+        return name in self._configs
+
+    def __iter__(self):
+        return iter(self._configs)
+
+    def __len__(self):
+        return len(self._configs)
+
+    def __repr__(self):
+        return 'Clusters({!r})'.format(list(self._configs))
+
+    def size(self, name):
+        cluster = self._compiled.get(name)
+        if cluster is not None:
+            return cluster.size
+        return self._configs[name]['size']
+
+    def compile(self):
+        for name in self._configs:
+            self[name]
+
+@attr.s(slots=True)
 class Instance:
     name = attr.ib()
     cluster = attr.ib()
     location = attr.ib()
 
 class Decoder:
-    def __init__(self, f):
+    def __init__(self, f, *, cache=False, lazy=False, sink=None, format='text', memo_size=4096,
+                 stats=None):
+        self.cache = cache
+        self.lazy = lazy
+        # decoded words by (type, word size, byte order, raw value)
+        self.memo = LRUCache(memo_size)
+        self.stats = stats
+        if stats is not None:
+            stats.watch_memo(self.memo)
+        self.sink = PrintSink() if sink is None else sink
+        self.emitter = EMITTERS[format](self.sink)
         if isinstance(f, str):
             self.filename = f
             self.reload()
@@ -177,22 +302,20 @@ class Decoder:
 
     def reload(self):
         try:
-            self.load(open(self.filename, 'r'))
+            if self.cache:
+                self.load_cached(self.filename)
+            else:
+                self.load(open(self.filename, 'r'))
         except:
             sys.stderr.write("Note: in layout file '{}':\n".format(self.filename))
             raise
 
     def load(self, stream):
-        layout = yaml.load(stream)
+        layout = yaml.load(stream, Loader=YAMLLoader)
 
-        clusters = {}
-        for name, config in layout['clusters'].items():
-            try:
-                cluster = Cluster(name, **config)
-                clusters[name] = cluster
-            except:
-                sys.stderr.write("Note: in cluster '{}':\n".format(name))
-                raise
+        clusters = Clusters(layout['clusters'])
+        if not self.lazy:
+            clusters.compile()
 
         instances = {}
         for k, v in layout['instances'].items():
@@ -200,23 +323,54 @@ class Decoder:
                 cluster_name, start = k.split(' ', 1)
                 start = int(start, 0)
                 name = v
-                cluster = clusters[cluster_name]
-                location = Location(start, start+cluster.size)
+                location = Location(start, start+clusters.size(cluster_name))
                 instance = Instance(name, cluster_name, location)
                 instances[name] = instance
             except:
                 sys.stderr.write("Note: in instance '{}':\n".format(k))
                 raise
 
+        ordered = sorted(instances.values(), key=attrgetter('location'))
+        index = LocationIndex()
+        for instance in ordered:
+            try:
+                index.add(instance.location)
+            except:
+                sys.stderr.write("Note: in instance '{}':\n".format(instance.name))
+                raise
+
         self.layout = layout
         self.clusters = clusters
         self.instances = instances
+        self._ordered = ordered
+        self._index = index
+        self.memo.clear()
+
+    def load_cached(self, filename):
+        """load the layout from the compiled cache, filling it on a miss"""
+        with open(filename, 'rb') as f:
+            content = f.read()
+        state = cache.load(content)
+        if state is not None:
+            (self.layout, self.clusters, self.instances,
+             self._ordered, self._index) = state
+            self.memo.clear()
+            return
+        self.load(content)
+        self.clusters.compile()
+        cache.store(content, (
+            self.layout, self.clusters, self.instances,
+            self._ordered, self._index,
+        ))
 
     def find_instance(self, addr):
-        addr = Location(addr)
-        for instance in self.instances.values():
-            if instance.location & addr:
-                return instance
+        idx = self._index.find(addr)
+        if idx is not None:
+            return self._ordered[idx]
+
+    def find_instances(self, loc):
+        ordered = self._ordered
+        return [ordered[idx] for idx in self._index.overlapping(loc.start, loc.stop)]
 
     def find_cluster(self, addr):
         instance = self.find_instance(addr)
@@ -228,31 +382,85 @@ class Decoder:
 
     def decode_fields(self, mv, reg_type):
         assert len(mv) == len(reg_type.kind)
-        word = mv.get_word(0)
-        values = []
-        for field in reg_type.fields:
-            # use native math instead?
-            offset = reg_type.kind.bits - field.location.stop
-            fmt = "p{}{}".format(offset, str(field.kind))
-            value = bitstruct.unpack(fmt, word)[0]
-            decoded = field.decode(value)
-            values.append((field.location, field.name, value, decoded))
-        return list(reversed(values))
+        return self.decode_word(mv.get_value(0), reg_type)
 
-    def decode(self, ms):
-        instance, cluster = self.find_cluster(ms.base)
-        if instance is None:
-            print('no instance found')
-            return
-        mv = MemoryView(ms, instance.location)
+    def decode_word(self, word, reg_type):
+        values = []
+        for location, name, shift, mask, enum, _ in reg_type.plan:
+            value = (word >> shift) & mask
+            decoded = enum[value] if enum is not None else None
+            values.append((location, name, value, decoded))
+        return values
+
+    def records(self, ms):
+        """yield the decoded registers and fields of a memory slice"""
+        stats = self.stats
+        found = False
+        for region in ms.regions():
+            if stats is None:
+                instances = self.find_instances(region)
+            else:
+                start = time.perf_counter()
+                instances = self.find_instances(region)
+                stats.add('lookup', time.perf_counter()-start)
+            for instance in instances:
+                yield from self.instance_records(ms, instance, region)
+                found = True
+        if not found:
+            if stats is not None:
+                stats.count('unmatched')
+            yield UnmatchedRecord(ms.inner_loc)
+
+    def decoded(self, word, reg_type, swapped):
+        """the memoized DecodedWord for a register value"""
+        # types are not hashable, but they live until the next load,
+        # which clears the memo
+        key = (id(reg_type), len(reg_type.kind), swapped, word)
+        decoded = self.memo.get(key)
+        if decoded is None:
+            if self.stats is None:
+                fields = self.decode_word(word, reg_type)
+            else:
+                start = time.perf_counter()
+                fields = self.decode_word(word, reg_type)
+                self.stats.add('extract', time.perf_counter()-start)
+            templates = tuple(entry[5] for entry in reg_type.plan)
+            decoded = self.memo.put(key, DecodedWord(tuple(fields), templates))
+        return decoded
+
+    def instance_records(self, ms, instance, region=None):
+        cluster = self.clusters[instance.cluster]
+        loc = instance.location
+        if region is not None:
+            loc = loc & region
+        mv = MemoryView(ms, loc)
         loc = mv.outer_loc - instance.location.start
         assert loc is not None
+        stats = self.stats
         for reg, reg_type in cluster.iterate(loc):
-            reg_mv = MemoryView(mv, reg.location - loc.start)
-            print(reg_mv.dump()+' # {} {}'.format(instance.name, reg.name))
-            #pretty((reg, reg_type))
-            for field_loc, name, value, decoded in self.decode_fields(reg_mv, reg_type):
-                if decoded:
-                    print(reg_mv.dump_bits(field_loc)+' # {}: {} = {} '.format(name, value, decoded))
-                else:
-                    print(reg_mv.dump_bits(field_loc)+' # {}: {}'.format(name, value))
+            size = len(reg_type.kind)
+            # registers are read in their own size, whatever the word size
+            # of the dump
+            reg_mv = MemoryView(mv, reg.location - loc.start, word_size=size)
+            if len(reg_mv) != size:
+                # the region ends within the register
+                continue
+            word = reg_mv.get_value(0)
+            address = reg_mv.map(0)
+            decoded = self.decoded(word, reg_type, ms.swapped)
+            if stats is not None:
+                stats.count('registers')
+                stats.count('fields', len(decoded.fields))
+            yield RegisterRecord(instance.name, reg.name, address, word, reg_mv, decoded)
+            for (field_loc, name, value, meaning), template in zip(decoded.fields, decoded.templates):
+                yield FieldRecord(instance.name, reg.name, address, name, field_loc, value, meaning,
+                                  template)
+
+    def decode(self, ms):
+        if self.stats is None:
+            self.emitter.emit(self.records(ms))
+            return
+        start = time.perf_counter()
+        self.emitter.emit(self.records(ms))
+        self.stats.add('decode', time.perf_counter()-start)
+        self.stats.count('slices')
@@ -0,0 +1,97 @@
+from .memory import MemorySlice
+from .output import NullSink
+from .parse import Parser
+from .parse import read_blocks
+
+
+def load(stream):
+    """parse a whole hex dump into a single sparse memory slice"""
+    parser = Parser(coalesce=True, sink=NullSink())
+    slices = []
+    for lines in read_blocks(stream):
+        slices.extend(parser.parse_lines(lines))
+    slices.extend(parser.flush())
+    if not slices:
+        return None
+    first = slices[0]
+    ms = MemorySlice(
+            min(s.base for s in slices),
+            swapped=first.swapped,
+            word_size=first.word_size)
+    for s in slices:
+        for region in s.regions():
+            ms.write(region.start, s.read(region.start, len(region)))
+    return ms
+
+def common_regions(a, b):
+    """the locations present in both memory slices"""
+    regions = []
+    a_regions = a.regions()
+    b_regions = b.regions()
+    i = j = 0
+    while i < len(a_regions) and j < len(b_regions):
+        overlap = a_regions[i] & b_regions[j]
+        if overlap is not None:
+            regions.append(overlap)
+        if a_regions[i].stop < b_regions[j].stop:
+            i += 1
+        else:
+            j += 1
+    return regions
+
+def changes(decoder, a, b):
+    """yield (instance, register, address, old, new, fields) for changed registers
+
+    fields lists (name, old, old decoded, new, new decoded) for each
+    changed field.
+    """
+    # each dump is decoded with its own byte order, raw bytes can only be
+    # compared directly when they match
+    old_order = 'little' if a.swapped else 'big'
+    new_order = 'little' if b.swapped else 'big'
+    same_order = a.swapped == b.swapped
+    for region in common_regions(a, b):
+        for instance in decoder.find_instances(region):
+            loc = instance.location & region
+            old = a.read(loc.start, len(loc))
+            new = b.read(loc.start, len(loc))
+            if same_order and old == new:
+                continue
+            cluster = decoder.clusters[instance.cluster]
+            offset = loc.start - instance.location.start
+            for idx in cluster.find_registers(offset, offset+len(loc)):
+                reg = cluster.registers[idx]
+                start = reg.location.start - offset
+                stop = reg.location.stop - offset
+                if start < 0 or stop > len(loc):
+                    continue
+                if same_order and old[start:stop] == new[start:stop]:
+                    continue
+                reg_type = cluster.types[reg.type_name]
+                old_word = int.from_bytes(old[start:stop], old_order)
+                new_word = int.from_bytes(new[start:stop], new_order)
+                if old_word == new_word:
+                    continue
+                fields = []
+                old_fields = decoder.decode_word(old_word, reg_type)
+                new_fields = decoder.decode_word(new_word, reg_type)
+                for (_, name, old_value, old_decoded), (_, _, new_value, new_decoded) in zip(
+                        old_fields, new_fields):
+                    if old_value != new_value:
+                        fields.append((name, old_value, old_decoded, new_value, new_decoded))
+                yield (instance, reg, loc.start+start, old_word, new_word, fields)
+
+def _value(value, decoded):
+    if decoded:
+        return '{} = {}'.format(value, decoded)
+    return '{}'.format(value)
+
+def render(changes, sink):
+    write = sink.write
+    for instance, reg, address, old, new, fields in changes:
+        width = len(reg.location)*2
+        write('{:08x}: {:0{width}x} -> {:0{width}x} # {} {}'.format(
+            address, old, new, instance.name, reg.name, width=width))
+        for name, old_value, old_decoded, new_value, new_decoded in fields:
+            write('{:08x}:   {}: {} -> {}'.format(
+                address, name, _value(old_value, old_decoded), _value(new_value, new_decoded)))
@@ -0,0 +1,195 @@
+import re
+from array import array
+
+# array type codes by item size, for swapping the bytes of whole lines
+_ARRAY_CODES = {array(code).itemsize: code for code in 'BHILQ'}
+
+
+def to_memory(data, size):
+    """convert big endian words of the given size to little endian memory order"""
+    if size == 1:
+        return data
+    words = array(_ARRAY_CODES[size], data)
+    words.byteswap()
+    return words.tobytes()
+
+
+class DumpFormat:
+    """base class for the parsers of one hex dump format each
+
+    PATTERN matches the lines of the format, it is used to detect the
+    format and to parse each line. Subclasses implement parse(line),
+    which returns the address and the data in memory order, or None for
+    lines which don't hold any.
+    """
+
+    name = None
+    PATTERN = None
+
+    @classmethod
+    def matches(cls, line):
+        return cls.PATTERN.match(line) is not None
+
+class MDFormat(DumpFormat):
+    """memtool, memedit and U-Boot md.b/md.w/md.l/md.q, words are values
+
+        f1022100: 00000000 00000011 00000001 03330007    ..............3.
+    """
+
+    name = 'md'
+    # the words end where the next character isn't a hex digit, parse
+    # also checks that enough is left over for the ASCII column
+    PATTERN = re.compile(
+            r'\s*([0-9a-fA-F]+):('
+            r'(?: [0-9a-fA-F]{16}){1,2}|(?: [0-9a-fA-F]{8}){1,4}|'
+            r'(?: [0-9a-fA-F]{4}){1,8}|(?: [0-9a-fA-F]{2}){1,16}'
+            r')(?![0-9a-fA-F])')
+
+    def parse(self, line):
+        m = self.PATTERN.match(line)
+        if m is None:
+            return None
+        words = m.group(2)
+        size = (words+' ').index(' ', 1)//2
+        tail = line[m.end(2):].rstrip('\r\n')
+        if tail.strip():
+            # the ASCII column has one character per byte after at least
+            # one space, so words which would leave less are part of it
+            step = 2*size+1
+            count = len(words)//step
+            while count > 1 and len(tail) <= count*size:
+                count -= 1
+                tail = words[count*step:(count+1)*step] + tail
+            words = words[:count*step]
+        return int(m.group(1), 16), to_memory(bytes.fromhex(words), size)
+
+class OpenOCDFormat(DumpFormat):
+    """OpenOCD mdb/mdh/mdw/mdd, words are values
+
+        0x80018000: 2265b1f5 91b7584a d8f16adf cd613e30 c386bbc4 1027c4d1 414c343c 1e2feb89
+    """
+
+    name = 'openocd'
+    PATTERN = re.compile(
+            r'0x([0-9a-fA-F]+): ('
+            r'[0-9a-fA-F]{16}(?: [0-9a-fA-F]{16})*|[0-9a-fA-F]{8}(?: [0-9a-fA-F]{8})*|'
+            r'[0-9a-fA-F]{4}(?: [0-9a-fA-F]{4})*|[0-9a-fA-F]{2}(?: [0-9a-fA-F]{2})*'
+            r')\s*$')
+
+    def parse(self, line):
+        m = self.PATTERN.match(line)
+        if m is None:
+            return None
+        words = m.group(2)
+        size = (words+' ').index(' ')//2
+        return int(m.group(1), 16), to_memory(bytes.fromhex(words), size)
+
+class HexdumpFormat(DumpFormat):
+    """hexdump -C, bytes in memory order, '*' for repeated lines
+
+        00000010  02 00 3e 00 01 00 00 00  c5 48 40 00 00 00 00 00  |..>......H@.....|
+    """
+
+    name = 'hexdump'
+    PATTERN = re.compile(r'([0-9a-fA-F]{8,})  ((?:[0-9a-fA-F]{2} {1,2}){1,16})')
+    # the offset alone ends the dump
+    END = re.compile(r'([0-9a-fA-F]{8,})\s*$')
+
+    def __init__(self):
+        self.previous = None
+        self.repeat = False
+
+    def parse(self, line):
+        if line.startswith('*'):
+            self.repeat = True
+            return None
+        m = self.PATTERN.match(line)
+        if m is None:
+            m = self.END.match(line)
+            if m is None or not self.repeat or self.previous is None:
+                return None
+            data = b''
+        else:
+            data = bytes.fromhex(m.group(2))
+        addr = int(m.group(1), 16)
+        if self.repeat and self.previous is not None:
+            # expand the lines left out as duplicates of the previous one
+            prev_addr, prev_data = self.previous
+            count = (addr-prev_addr)//len(prev_data)
+            data = prev_data*(count-1) + data
+            addr = prev_addr+len(prev_data)
+        self.repeat = False
+        if data:
+            self.previous = (addr+len(data)-min(len(data), 16), data[-16:])
+        return addr, data
+
+class XXDFormat(DumpFormat):
+    """xxd, groups of bytes in memory order, two spaces before the ASCII column
+
+        00000000: 7f45 4c46 0201 0100 0000 0000 0000 0000  .ELF............
+    """
+
+    name = 'xxd'
+    PATTERN = re.compile(r'([0-9a-fA-F]{8,}): ((?:[0-9a-fA-F]{2})+(?: (?:[0-9a-fA-F]{2})+)*) {2,}')
+    # the hex column is padded to 39 characters and followed by exactly
+    # two spaces, which tells xxd apart from U-Boot's md.w
+    COLUMNS = re.compile(r'[0-9a-fA-F]{8,}: [0-9a-fA-F ]{39}  (?! )')
+
+    @classmethod
+    def matches(cls, line):
+        return cls.COLUMNS.match(line) is not None
+
+    def parse(self, line):
+        m = self.PATTERN.match(line)
+        if m is None:
+            return None
+        return int(m.group(1), 16), bytes.fromhex(m.group(2))
+
+class Devmem2Format(DumpFormat):
+    """devmem2, one 32 bit value per line
+
+        Value at address 0x80018000 (0xb6f9e000): 0x2265B1F5
+    """
+
+    name = 'devmem2'
+    PATTERN = re.compile(r'Value at address 0x([0-9a-fA-F]+) \(0x[0-9a-fA-F]+\): 0x([0-9a-fA-F]+)')
+
+    def parse(self, line):
+        m = self.PATTERN.match(line)
+        if m is None:
+            return None
+        return int(m.group(1), 16), int(m.group(2), 16).to_bytes(4, 'little')
+
+# in order of precedence, md is the most general one
+FORMATS = [
+    HexdumpFormat,
+    XXDFormat,
+    OpenOCDFormat,
+    Devmem2Format,
+    MDFormat,
+]
+
+
+def get(name):
+    for cls in FORMATS:
+        if cls.name == name:
+            return cls
+    raise KeyError(name)
+
+def detect(lines, *, limit=16):
+    """return the format class matching most of the first non-empty lines, or None"""
+    scores = [0] * len(FORMATS)
+    seen = 0
+    for line in lines:
+        if not line.strip():
+            continue
+        for idx, cls in enumerate(FORMATS):
+            if cls.matches(line):
+                scores[idx] += 1
+        seen += 1
+        if seen >= limit:
+            break
+    best = max(scores)
+    if not best:
+        return None
+    return FORMATS[scores.index(best)]
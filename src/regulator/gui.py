@@ -0,0 +1,60 @@
+import gi
+
+from . import decode, parse
+
+gi.require_version('Gdk', '3.0') # isort:skip
+gi.require_version('Gtk', '3.0') # isort:skip
+from gi.repository import Gdk, Gio, Gtk # isort:skip
+
+
+class DecoderMonitor:
+    def __init__(self, filename, *, stats=None):
+        self.filename = filename
+        self.file = Gio.File.new_for_path(filename)
+        self.monitor = self.file.monitor_file(
+                Gio.FileMonitorFlags.NONE,
+                None)
+        self.monitor.connect('changed', self.on_change)
+        print('monitoring layout {}'.format(filename))
+        # compile all clusters on each load, so that a broken layout edit
+        # fails the reload instead of the next decode
+        self.decoder = decode.Decoder(filename, stats=stats)
+        print('decoder loaded')
+
+    def reload(self):
+        self.decoder.reload()
+        print('decoder reloaded')
+
+    def on_change(self, file_monitor, file, other_file, event_type):
+        if event_type == Gio.FileMonitorEvent.CREATED:
+            pass
+        elif event_type == Gio.FileMonitorEvent.DELETED:
+            pass
+        elif event_type == Gio.FileMonitorEvent.CHANGED:
+            pass
+        elif event_type == Gio.FileMonitorEvent.CHANGES_DONE_HINT:
+            self.reload()
+        elif event_type == Gio.FileMonitorEvent.ATTRIBUTE_CHANGED:
+            pass
+        else:
+            print(self, event_type)
+
+class ClipboardHandler:
+    def __init__(self, decoder, *, stats=None):
+        self.decoder = decoder
+        self.parser = parse.Parser(coalesce=True, stats=stats)
+        print('parser started')
+        self.clipboard = Gtk.Clipboard.get(Gdk.SELECTION_PRIMARY,)
+        self.clipboard.connect('owner-change', self.on_change)
+        print('monitoring primary selection')
+
+    def on_change(self, clipboard, _):
+        text = clipboard.wait_for_text()
+        if text is None:
+            return
+        for ms in self.parser.parse_dirty(text):
+            self.decoder.decode(ms)
+        print('selection done')
+
+def main():
+    Gtk.main()
@@ -0,0 +1,245 @@
+import mmap
+import os
+import sys
+import time
+from array import array
+from bisect import bisect_left
+from bisect import bisect_right
+from datetime import datetime
+
+# array type codes by item size, for the word columns
+_WORD_CODES = {array(code).itemsize: code for code in 'BHILQ'}
+
+
+class Store:
+    """an append-only, columnar store of register samples
+
+    Each register address gets two files in the store directory: the
+    sample times as float seconds in <address>.time and the raw words
+    as little endian integers of the register's size in <address>.u<bits>.
+    Samples are buffered in memory until flush appends them. Times are
+    stored as recorded, where they go back (the clock was set back, or an
+    earlier run recorded later times) a new sorted run of samples starts,
+    and its index is appended to <address>.runs. A time range is found by
+    bisecting each run of the memory mapped time column, so queries only
+    read the samples they return.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self.pending = {}
+        # [last time, sample count] of each column written to since the
+        # store was opened
+        self.columns = {}
+
+    def column_paths(self, address, size):
+        name = os.path.join(self.path, '{:08x}'.format(address))
+        return name+'.time', '{}.u{}'.format(name, size*8)
+
+    def runs_path(self, address):
+        return os.path.join(self.path, '{:08x}.runs'.format(address))
+
+    def open_column(self, address, size):
+        """cut a column back to its complete samples, return (last time, count)"""
+        paths = self.column_paths(address, size)
+        sizes = []
+        for path in paths:
+            try:
+                sizes.append(os.path.getsize(path))
+            except FileNotFoundError:
+                sizes.append(0)
+        # a crash between appending the words and the times leaves extra
+        # words, which would be paired with the times of later samples
+        count = min(sizes[0] // 8, sizes[1] // size)
+        for path, file_size, item_size in zip(paths, sizes, (8, size)):
+            if file_size != count*item_size:
+                os.truncate(path, count*item_size)
+        if not count:
+            return float('-inf'), 0
+        with open(paths[0], 'rb') as f:
+            f.seek((count-1)*8)
+            times = array('d', f.read(8))
+        if sys.byteorder != 'little':
+            times.byteswap()
+        return times[0], count
+
+    def append(self, timestamp, address, size, word):
+        """buffer one sample of the size byte register at address"""
+        key = (address, size)
+        column = self.pending.get(key)
+        if column is None:
+            column = self.pending[key] = (array('d'), array(_WORD_CODES[size]), array('Q'))
+        state = self.columns.get(key)
+        if state is None:
+            state = self.columns[key] = list(self.open_column(address, size))
+        last, count = state
+        if timestamp < last:
+            # the samples from here on are another sorted run
+            column[2].append(count)
+        state[:] = timestamp, count+1
+        column[0].append(timestamp)
+        column[1].append(word)
+
+    def record(self, decoder, ms, timestamp=None):
+        """buffer the words of all registers fully contained in a memory slice"""
+        if timestamp is None:
+            timestamp = time.time()
+        byteorder = 'little' if ms.swapped else 'big'
+        count = 0
+        for region in ms.regions():
+            for instance in decoder.find_instances(region):
+                loc = instance.location & region
+                data = ms.read(loc.start, len(loc))
+                cluster = decoder.clusters[instance.cluster]
+                offset = loc.start - instance.location.start
+                for idx in cluster.find_registers(offset, offset+len(loc)):
+                    reg = cluster.registers[idx]
+                    start = reg.location.start - offset
+                    stop = reg.location.stop - offset
+                    if start < 0 or stop > len(loc):
+                        continue
+                    word = int.from_bytes(data[start:stop], byteorder)
+                    self.append(timestamp, loc.start+start, stop-start, word)
+                    count += 1
+        return count
+
+    def flush(self):
+        """append the buffered samples to the column files"""
+        pending, self.pending = self.pending, {}
+        for (address, size), (times, words, runs) in pending.items():
+            if sys.byteorder != 'little':
+                times.byteswap()
+                words.byteswap()
+                runs.byteswap()
+            time_path, word_path = self.column_paths(address, size)
+            # runs first, so that a crash never leaves unsorted times, a run
+            # without its times only splits a sorted run later on
+            if runs:
+                with open(self.runs_path(address), 'ab') as f:
+                    runs.tofile(f)
+            # words before times, so that a crash never leaves times without
+            # words, open_column drops words without times
+            with open(word_path, 'ab') as f:
+                words.tofile(f)
+            with open(time_path, 'ab') as f:
+                times.tofile(f)
+
+    def series(self, address, size, *, since=None, until=None):
+        """return the (times, words) arrays of the samples from since to until"""
+        times = array('d')
+        words = array(_WORD_CODES[size])
+        try:
+            time_file, word_file = self.open_files(address, size)
+        except FileNotFoundError:
+            return times, words
+        with time_file, word_file:
+            count = min(
+                    os.fstat(time_file.fileno()).st_size // times.itemsize,
+                    os.fstat(word_file.fileno()).st_size // size)
+            if not count:
+                return times, words
+            ranges = []
+            with mmap.mmap(time_file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                column = memoryview(mapped)[:count*times.itemsize].cast('d')
+                try:
+                    for start, stop in self.runs(address, count):
+                        lo = start if since is None else bisect_left(column, since, start, stop)
+                        hi = stop if until is None else bisect_right(column, until, start, stop)
+                        if lo < hi:
+                            times.frombytes(column[lo:hi].tobytes())
+                            ranges.append((lo, hi))
+                finally:
+                    column.release()
+            for lo, hi in ranges:
+                word_file.seek(lo*size)
+                words.frombytes(word_file.read((hi-lo)*size))
+        if sys.byteorder != 'little':
+            times.byteswap()
+            words.byteswap()
+        return times, words
+
+    def runs(self, address, count):
+        """return the (start, stop) indices of the sorted runs of the first count samples"""
+        starts = array('Q')
+        try:
+            with open(self.runs_path(address), 'rb') as f:
+                starts.frombytes(f.read())
+        except FileNotFoundError:
+            pass
+        if sys.byteorder != 'little':
+            starts.byteswap()
+        # starts left behind by a crash may lie beyond the samples
+        bounds = sorted({0, count}.union(start for start in starts if start < count))
+        return list(zip(bounds, bounds[1:]))
+
+    def open_files(self, address, size):
+        """open the time and word files of a column for reading"""
+        time_path, word_path = self.column_paths(address, size)
+        time_file = open(time_path, 'rb')
+        try:
+            return time_file, open(word_path, 'rb')
+        except FileNotFoundError:
+            time_file.close()
+            raise
+
+def resolve(decoder, name):
+    """return (instance, register, type, field) for each match of [INSTANCE.]REG[.FIELD]
+
+    field is the type's plan entry for the field, or None for the whole
+    register.
+    """
+    parts = name.split('.')
+    matches = []
+    for instance in decoder.instances.values():
+        if parts[0] == instance.name and len(parts) > 1:
+            reg_name, field_name = parts[1], '.'.join(parts[2:]) or None
+        else:
+            reg_name, field_name = parts[0], '.'.join(parts[1:]) or None
+        cluster = decoder.clusters[instance.cluster]
+        for reg in cluster.registers:
+            if reg.name != reg_name:
+                continue
+            reg_type = cluster.types[reg.type_name]
+            if field_name is None:
+                matches.append((instance, reg, reg_type, None))
+                continue
+            for field in reg_type.plan:
+                if field[1] == field_name:
+                    matches.append((instance, reg, reg_type, field))
+    return matches
+
+def format_time(timestamp):
+    return datetime.fromtimestamp(timestamp).strftime('%Y-%m-%d %H:%M:%S.%f')
+
+def history(store, instance, reg, reg_type, field=None, *, since=None, until=None, changes=False):
+    """yield (time, address, value, decoded) for the samples of a register or field"""
+    address = instance.location.start + reg.location.start
+    times, words = store.series(address, len(reg.location), since=since, until=until)
+    if field is not None:
+        _, _, shift, mask, enum, _ = field
+    previous = None
+    for timestamp, word in zip(times, words):
+        if field is None:
+            value, decoded = word, None
+        else:
+            value = (word >> shift) & mask
+            decoded = enum[value] if enum is not None else None
+        if changes and value == previous:
+            continue
+        previous = value
+        yield timestamp, address, value, decoded
+
+def render(samples, instance, reg, field, sink):
+    write = sink.write
+    if field is None:
+        width = len(reg.location)*2
+        for timestamp, address, value, _ in samples:
+            write('{} {:08x}: {:0{width}x} # {} {}'.format(
+                format_time(timestamp), address, value, instance.name, reg.name, width=width))
+        return
+    for timestamp, address, value, decoded in samples:
+        if decoded:
+            value = '{} = {}'.format(value, decoded)
+        write('{} {:08x}: {}: {} # {} {}'.format(
+            format_time(timestamp), address, field[1], value, instance.name, reg.name))
@@ -1,13 +1,29 @@
+import weakref
+from bisect import bisect_left, bisect_right
+
 import attr
 
 
-@attr.s(frozen=True)
+# locations parsed from layouts, shared by all fields and registers of
+# the loaded layouts
+_PARSED = weakref.WeakValueDictionary()
+
+
+@attr.s(frozen=True, slots=True)
 class Location:
     start = attr.ib()
     stop = attr.ib(default=None)
 
     @classmethod
     def from_str(cls, s, *, size=None):
+        key = (cls, s, size)
+        loc = _PARSED.get(key)
+        if loc is None:
+            loc = _PARSED[key] = cls._from_str(s, size=size)
+        return loc
+
+    @classmethod
+    def _from_str(cls, s, *, size=None):
         def from_hex_or_dec(s):
             if s.startswith('0x'):
                 return int(s, 16)
@@ -110,3 +126,53 @@ class Location:
 
     def reverse(self, size):
         return Location(size-self.stop, size-self.start)
+
+class LocationIndex:
+    """sorted start/stop arrays for bisecting locations added in order"""
+
+    def __init__(self, locations=(), *, overlap=False):
+        self.overlap = overlap
+        self.starts = []
+        self.stops = []
+        self._max_stops = []
+        for loc in locations:
+            self.add(loc)
+
+    def add(self, loc):
+        if self.starts:
+            if loc.start < self.starts[-1]:
+                raise ValueError('{} added out of order'.format(loc.hex()))
+            if loc.start < self._max_stops[-1] and not self.overlap:
+                prev = Location(self.starts[-1], self.stops[-1])
+                raise ValueError('{} overlaps {}'.format(loc.hex(), prev.hex()))
+            max_stop = max(self._max_stops[-1], loc.stop)
+        else:
+            max_stop = loc.stop
+        self.starts.append(loc.start)
+        self.stops.append(loc.stop)
+        self._max_stops.append(max_stop)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def overlapping(self, start, stop):
+        """indices of all locations overlapping start…stop-1"""
+        lo = bisect_right(self._max_stops, start)
+        hi = bisect_left(self.starts, stop)
+        stops = self.stops
+        return [idx for idx in range(lo, hi) if stops[idx] > start]
+
+    def starting(self, start, stop):
+        """indices of all locations starting within start…stop-1"""
+        return range(
+                bisect_left(self.starts, start),
+                bisect_left(self.starts, stop)
+        )
+
+    def find(self, addr):
+        lo = bisect_right(self._max_stops, addr)
+        hi = bisect_right(self.starts, addr)
+        stops = self.stops
+        for idx in range(lo, hi):
+            if stops[idx] > addr:
+                return idx
@@ -1,11 +1,186 @@
 import binascii
-import signal
 
 import attr
-import bitstruct
 
 from .location import Location
 
+# hex digits to their bits, followed by the nibble separator
+_NIBBLES = str.maketrans({
+    '{:x}'.format(i): '{:04b}_'.format(i) for i in range(16)
+})
+
+
+@attr.s(slots=True, frozen=True)
+class BitsTemplate:
+    """the data independent parts of a dump_bits line
+
+    columns and swapped_columns hold the padding before and after the
+    shown hex digits and the slice selecting them, bits selects the field
+    from the nibble separated bits of the word.
+    """
+    columns = attr.ib()
+    swapped_columns = attr.ib()
+    head = attr.ib()
+    bits = attr.ib()
+    tail = attr.ib()
+
+def bits_template(bit_loc, word_size):
+    """the BitsTemplate for a field at bit_loc in a word of word_size bytes"""
+    width = word_size*8
+    bit_loc = bit_loc.reverse(width)
+    assert 0 <= bit_loc.start < bit_loc.stop <= width
+
+    mask_loc = (bit_loc//8).reverse(word_size)
+    def columns(start, stop):
+        return ('  '*start, '  '*(word_size-stop), slice(start*2, stop*2))
+
+    # bit i of the word is at i + i//4 in the nibble separated bits
+    dots = '_'.join(['....']*(width//4))
+    head = bit_loc.start + bit_loc.start//4
+    tail = bit_loc.stop-1 + (bit_loc.stop-1)//4 + 1
+    return BitsTemplate(
+        columns=columns(mask_loc.start, mask_loc.stop),
+        swapped_columns=columns(word_size-mask_loc.stop, word_size-mask_loc.start),
+        head=dots[:head],
+        bits=slice(head, tail),
+        tail=dots[tail:],
+    )
+
+class MemoryImage:
+    """a sparse memory image made of pages with per-byte presence"""
+
+    PAGE_SIZE = 4096
+    PAGE_SHIFT = 12
+
+    _ZEROS = bytes(PAGE_SIZE)
+    _ONES = b'\01' * PAGE_SIZE
+
+    def __init__(self):
+        self.pages = {}
+        self.present = {}
+
+    def write(self, addr, data):
+        data = memoryview(data).cast('B')
+        pos = 0
+        while pos < len(data):
+            number, offset = divmod(addr+pos, self.PAGE_SIZE)
+            size = min(self.PAGE_SIZE-offset, len(data)-pos)
+            page = self.pages.get(number)
+            if page is None:
+                page = self.pages[number] = bytearray(self.PAGE_SIZE)
+                self.present[number] = bytearray(self.PAGE_SIZE)
+            page[offset:offset+size] = data[pos:pos+size]
+            self.present[number][offset:offset+size] = self._ONES[:size]
+            pos += size
+
+    def read(self, addr, size):
+        """read size bytes starting at addr, missing bytes read as zero"""
+        chunks = []
+        pos = 0
+        while pos < size:
+            number, offset = divmod(addr+pos, self.PAGE_SIZE)
+            count = min(self.PAGE_SIZE-offset, size-pos)
+            page = self.pages.get(number, self._ZEROS)
+            chunks.append(page[offset:offset+count])
+            pos += count
+        return b''.join(chunks)
+
+    def view(self, addr, size):
+        """like read, but a memoryview into the page if it holds all bytes"""
+        number, offset = divmod(addr, self.PAGE_SIZE)
+        page = self.pages.get(number)
+        if page is None or offset+size > self.PAGE_SIZE:
+            return self.read(addr, size)
+        return memoryview(page)[offset:offset+size]
+
+    def __getitem__(self, addr):
+        page = self.pages.get(addr >> self.PAGE_SHIFT)
+        if page is None:
+            return 0
+        return page[addr & (self.PAGE_SIZE-1)]
+
+    def is_present(self, addr, size=1):
+        pos = 0
+        while pos < size:
+            number, offset = divmod(addr+pos, self.PAGE_SIZE)
+            count = min(self.PAGE_SIZE-offset, size-pos)
+            present = self.present.get(number)
+            if present is None or 0 in present[offset:offset+count]:
+                return False
+            pos += count
+        return True
+
+    def regions(self):
+        """the locations of all runs of present bytes, in order"""
+        regions = []
+        start = stop = None
+        for number in sorted(self.present):
+            present = self.present[number]
+            page_base = number * self.PAGE_SIZE
+            offset = present.find(1)
+            while offset >= 0:
+                end = present.find(0, offset)
+                if end < 0:
+                    end = self.PAGE_SIZE
+                if stop == page_base+offset:
+                    stop = page_base+end
+                else:
+                    if start is not None:
+                        regions.append(Location(start, stop))
+                    start, stop = page_base+offset, page_base+end
+                offset = present.find(1, end)
+        if start is not None:
+            regions.append(Location(start, stop))
+        return regions
+
+class MappedImage:
+    """a read-only memory image backed by a buffer, such as a mapped file
+
+    Only the parts which are actually read are touched, so pages of a
+    mapped file outside of any instance are never loaded.
+    """
+
+    def __init__(self, base, buffer):
+        self.base = base
+        self.buffer = memoryview(buffer).cast('B')
+
+    def read(self, addr, size):
+        """read size bytes starting at addr, missing bytes read as zero"""
+        start = addr-self.base
+        stop = start+size
+        if 0 <= start and stop <= len(self.buffer):
+            return self.buffer[start:stop].tobytes()
+        data = bytearray(size)
+        lo = max(start, 0)
+        hi = min(stop, len(self.buffer))
+        if lo < hi:
+            data[lo-start:hi-start] = self.buffer[lo:hi]
+        return bytes(data)
+
+    def view(self, addr, size):
+        """like read, but a memoryview into the buffer if it holds all bytes"""
+        start = addr-self.base
+        if 0 <= start and start+size <= len(self.buffer):
+            return self.buffer[start:start+size]
+        return self.read(addr, size)
+
+    def __getitem__(self, addr):
+        offset = addr-self.base
+        if 0 <= offset < len(self.buffer):
+            return self.buffer[offset]
+        return 0
+
+    def is_present(self, addr, size=1):
+        return self.base <= addr and addr+size <= self.base+len(self.buffer)
+
+    def regions(self):
+        if not self.buffer:
+            return []
+        return [Location(self.base, self.base+len(self.buffer))]
+
+    def release(self):
+        """drop the reference to the buffer, so that it can be closed"""
+        self.buffer.release()
 
 class MemorySlice:
     def _shift_slice(self, value, offset):
@@ -17,77 +192,122 @@ class MemorySlice:
 
     def __init__(self, base, *, swapped=True, word_size=1):
         self.base = base
-        self.data = bytearray()
+        self.stop = base
+        self.image = MemoryImage()
         self.swapped = swapped # little endian
         self.word_size = word_size
 
-    def __setitem__(self, index, value):
-        index = self._shift_slice(index, -self.base)
+    @classmethod
+    def from_buffer(cls, base, buffer, *, swapped=True, word_size=1):
+        """a read-only slice over raw bytes in memory order, without copying"""
+        ms = cls(base, swapped=swapped, word_size=word_size)
+        ms.image = MappedImage(base, buffer)
+        ms.stop = base+len(ms.image.buffer)
+        return ms
 
+    def __setitem__(self, index, value):
         if isinstance(index, slice):
-            assert 0 <= index.start < index.stop <= (1024*1024)
+            assert self.base <= index.start < index.stop
             value = binascii.unhexlify(value)
             assert len(value) == index.stop-index.start
             assert len(value) in [1, 2, 4, 8]
             if self.swapped:
                 value = value[::-1]
-            size = max(len(self.data), index.stop)
+            self.write(index.start, value)
         else:
-            assert 0 <= index < (1024*1024)
+            assert self.base <= index
             assert 0 <= value <= 255
-            size = max(len(self.data), index+1)
+            self.write(index, bytes((value, )))
 
-        if len(self.data) < size:
-            self.data.extend(b'\00' * (size-len(self.data)))
-        self.data[index] = value
-    
     def __getitem__(self, index):
-        index = self._shift_slice(index, -self.base)
-        value = self.data[index]
-
         if isinstance(index, slice):
+            assert index.step is None
+            if not self.base <= index.start <= index.stop <= self.stop:
+                raise IndexError()
+            value = self.image.read(index.start, index.stop-index.start)
             assert len(value) in [1, 2, 4, 8]
             if self.swapped:
                 value = value[::-1]
             return binascii.hexlify(value).decode('ASCII')
         else:
-            return value
+            if not self.base <= index < self.stop:
+                raise IndexError()
+            return self.image[index]
 
     def __str__(self):
         lines = []
-        for line_offset in range(self.base, self.base+len(self.data), 16):
-            line = ["{:08x}:".format(line_offset)]
-            for byte_offset in range(line_offset, self.base+len(self.data), self.word_size):
-                line.append(self[byte_offset:byte_offset+self.word_size])
-            lines.append(' '.join(line))
+        for region in self.regions():
+            for line_offset in range(region.start, region.stop, 16):
+                line = ["{:08x}:".format(line_offset)]
+                line_stop = min(line_offset+16, region.stop)
+                for byte_offset in range(line_offset, line_stop, self.word_size):
+                    line.append(self[byte_offset:byte_offset+self.word_size])
+                lines.append(' '.join(line))
         return '\n'.join(lines)
 
     def __len__(self):
-        return len(self.data)
+        return self.stop-self.base
+
+    def write(self, addr, data):
+        """store raw bytes in memory order"""
+        assert self.base <= addr
+        self.image.write(addr, data)
+        self.stop = max(self.stop, addr+len(data))
+
+    def read(self, addr, size):
+        return self.image.read(addr, size)
+
+    def regions(self):
+        return self.image.regions()
+
+    def can_extend(self, other):
+        return (
+            other.base == self.stop and
+            other.word_size == self.word_size and
+            other.swapped == self.swapped
+        )
+
+    def extend(self, other):
+        assert self.can_extend(other)
+        for region in other.regions():
+            self.write(region.start, other.read(region.start, len(region)))
 
     @property
     def inner_loc(self):
-        return Location(self.base, self.base+len(self.data))
+        return Location(self.base, self.stop)
 
     def map(self, addr):
         return addr
 
 class MemoryView:
-    """a relative view into a memory slice"""
+    """a relative view into a memory slice
+
+    Words are read and dumped in the word size of the slice, unless the
+    view is given its own, such as the size of a register.
+    """
 
-    def __init__(self, parent, loc):
+    def __init__(self, parent, loc, *, word_size=None):
         self._parent = parent
+        self.word_size = parent.word_size if word_size is None else word_size
         overlap = parent.inner_loc & loc
         if overlap is None:
             raise ValueError("{} and {} do not overlap".format(parent.inner_loc, loc))
         self._start = overlap.start
         self._stop = overlap.stop
+        # nested views compose their offsets instead of chaining lookups
+        if isinstance(parent, MemoryView):
+            self._root = parent._root
+            self._offset = parent._offset + overlap.start
+        else:
+            self._root = parent
+            self._offset = overlap.start
+        self._byteorder = 'little' if parent.swapped else 'big'
 
     def __getitem__(self, index):
-        if index < 0 or index >= self._stop:
+        if index < 0 or index >= self._stop-self._start:
             raise IndexError()
 
-        return self._parent[self._start+index]
+        return self._root.image[self._offset+index]
 
     def __repr__(self):
         return "{}/{}".format(repr(self._parent), self.outer_loc.hex())
@@ -103,89 +323,85 @@ class MemoryView:
     def inner_loc(self):
         return Location.from_size(self._stop-self._start)
 
-    @property
-    def word_size(self):
-        return self._parent.word_size
-
     @property
     def swapped(self):
-        return self._parent.swapped
+        return self._root.swapped
+
+    def get_bytes(self, addr, size):
+        """raw bytes in memory order, without copying where possible"""
+        assert 0 <= addr and addr+size <= self._stop-self._start
+        return self._root.image.view(self._offset+addr, size)
 
     def get_word(self, addr):
         assert addr % self.word_size == 0
-        data = []
-        idxs = range(addr, addr+self.word_size)
+        data = list(self.get_bytes(addr, self.word_size))
         if self.swapped:
-            idxs = reversed(idxs)
-        for i in idxs:
-            data.append(self[i])
+            data.reverse()
         return data
 
+    def get_value(self, addr):
+        assert addr % self.word_size == 0
+        return int.from_bytes(self.get_bytes(addr, self.word_size), self._byteorder)
+
     def get_word_bits(self, addr):
-        return ''.join('{:08b}'.format(x) for x in self.get_word(addr))
+        return '{:0{}b}'.format(self.get_value(addr), self.word_size*8)
 
     def map(self, index):
-        return self._parent.map(self._start+index)
+        return self._root.map(self._offset+index)
 
     @property
     def mapped_loc(self):
         return Location(self.map(0), self.map(len(self)))
 
     def dump(self):
-        offset = self.map(0)
-        loc = self.inner_loc + offset
+        """hex dump of the lines around the view, '--' for bytes outside of it"""
+        start = self.map(0)
+        stop = start+len(self)
+        size = self.word_size
+        data = bytes(self.get_bytes(0, len(self)))
+        missing = '--'*size
         lines = []
-        for line_loc in loc.range(step=16, align=True):
-            line = ['{:08x}: '.format(line_loc.start)]
-            for word_loc in line_loc.range(step=self.word_size):
-                byte_range = list(word_loc.range())
-                if self.swapped:
-                    byte_range = reversed(byte_range)
-                for byte_loc in byte_range:
-                    if byte_loc & loc:
-                        line.append('%02x' % self[byte_loc.start - offset])
-                    else:
-                        line.append('--')
-                line.append(' ')
-            lines.append(''.join(line[:-1]))
+        for line in range(start & ~15, stop, 16):
+            words = []
+            for addr in range(line, line+16, size):
+                if start <= addr and addr+size <= stop:
+                    word = data[addr-start:addr-start+size]
+                    words.append((word[::-1] if self.swapped else word).hex())
+                elif addr+size <= start or stop <= addr:
+                    words.append(missing)
+                else:
+                    words.append(self._partial_word(data, start, stop, addr))
+            lines.append('{:08x}: {}'.format(line, ' '.join(words)))
         return '\n'.join(lines)
 
-    def dump_bits(self, bit_loc):
-        bit_loc = bit_loc.reverse(self.word_size*8)
+    def _partial_word(self, data, start, stop, addr):
+        offsets = range(addr, addr+self.word_size)
+        if self.swapped:
+            offsets = reversed(offsets)
+        return ''.join(
+            '{:02x}'.format(data[offset-start]) if start <= offset < stop else '--'
+            for offset in offsets)
 
+    def dump_bits(self, bit_loc, template=None):
+        """render the bits of a field, using its compiled template if given"""
         assert len(self) == self.word_size
 
-        mapped_loc = self.mapped_loc
-        aligned_loc = mapped_loc.align(16)
-        shift = mapped_loc.start - aligned_loc.start
-        assert shift % self.word_size == 0
-
-        line = ['{:08x}: '.format(mapped_loc.start)]
+        if template is None:
+            template = bits_template(bit_loc, self.word_size)
+        start = self.map(0)
+        assert start % self.word_size == 0
 
-        bit_offset = self.word_size * 8 - bit_loc.stop
-
-        mask_loc = (bit_loc//8).reverse(self.word_size)
-        byte_range = list(self.inner_loc.range())
+        value = self.get_value(0)
+        digits = '{:0{}x}'.format(value, self.word_size*2)
+        bits = digits.translate(_NIBBLES)
         if self.swapped:
-            byte_range = reversed(byte_range)
-        for byte_loc in byte_range:
-            if byte_loc & mask_loc:
-                line.append('%02x' % self[byte_loc.start])
-            else:
-                line.append('  ')
-                bit_offset -= 8
-        line.append(' = ')
-
-        word_bits = self.get_word_bits(0)
-        bits = '.'*bit_loc.start + \
-                word_bits[bit_loc.start:bit_loc.stop] + \
-                '.'*(self.word_size*8 - bit_loc.stop)
-
-        assert len(bits) == self.word_size*8
-
-        for i in range(0, len(bits), 4):
-            line.append(bits[i:i+4])
-            line.append('_')
-        line.pop()
-
-        return ''.join(line)
+            left, right, columns = template.swapped_columns
+        else:
+            left, right, columns = template.columns
+
+        return ''.join((
+            '{:08x}: '.format(start),
+            left, digits[columns], right,
+            ' = ',
+            template.head, bits[template.bits], template.tail,
+        ))
@@ -0,0 +1,186 @@
+import csv
+import json
+import sys
+from collections import OrderedDict
+
+from .records import FieldRecord
+from .records import RegisterRecord
+from .records import UnmatchedRecord
+
+
+class PrintSink:
+    """write each line immediately, like print()"""
+
+    def __init__(self, stream=None):
+        self.stream = stream
+
+    def write(self, line):
+        print(line, file=self.stream)
+
+    def flush(self):
+        (sys.stdout if self.stream is None else self.stream).flush()
+
+class NullSink:
+    """discard all lines"""
+
+    def write(self, line):
+        pass
+
+    def flush(self):
+        pass
+
+class ListSink:
+    """collect lines until they are taken"""
+
+    def __init__(self):
+        self.lines = []
+
+    def write(self, line):
+        self.lines.append(line)
+
+    def flush(self):
+        pass
+
+    def take(self):
+        """return the collected lines as text and forget them"""
+        if not self.lines:
+            return ''
+        self.lines.append('')
+        text = '\n'.join(self.lines)
+        self.lines = []
+        return text
+
+class BufferedSink:
+    """collect lines and write them to the stream in large blocks"""
+
+    def __init__(self, stream=None, *, size=64*1024):
+        self.stream = sys.stdout if stream is None else stream
+        self.size = size
+        self.lines = []
+        self.pending = 0
+
+    def write(self, line):
+        self.lines.append(line)
+        self.pending += len(line)+1
+        if self.pending >= self.size:
+            self.flush()
+
+    def flush(self):
+        if self.lines:
+            self.lines.append('')
+            self.stream.write('\n'.join(self.lines))
+            self.lines = []
+            self.pending = 0
+        self.stream.flush()
+
+class TextEmitter:
+    """render records as annotated hex dump lines"""
+
+    def __init__(self, sink):
+        self.sink = sink
+
+    def emit(self, records):
+        write = self.sink.write
+        view = None
+        lines = None
+        prefix = ''
+        for record in records:
+            if isinstance(record, FieldRecord):
+                if lines is not None:
+                    write(prefix+next(lines))
+                else:
+                    write(self.field_line(view, record.location, record.field,
+                                          record.value, record.decoded, record.template))
+            elif isinstance(record, RegisterRecord):
+                view = record.view
+                write(view.dump()+' # {} {}'.format(record.instance, record.register))
+                decoded = record.decoded
+                if decoded is None:
+                    lines = None
+                    continue
+                # memoized words share their field lines, except for the address
+                prefix = '{:08x}: '.format(record.address)
+                if decoded.lines is None:
+                    decoded.lines = [
+                        self.field_line(view, *field, template=template)[len(prefix):]
+                        for field, template in zip(decoded.fields, decoded.templates)
+                    ]
+                lines = iter(decoded.lines)
+            elif isinstance(record, UnmatchedRecord):
+                write('no instance found')
+
+    @staticmethod
+    def field_line(view, location, name, value, decoded, template=None):
+        if decoded:
+            return view.dump_bits(location, template)+' # {}: {} = {} '.format(name, value, decoded)
+        return view.dump_bits(location, template)+' # {}: {}'.format(name, value)
+
+def _record_row(record):
+    # keep the key order stable on Python 3.5, where dicts are unordered
+    if isinstance(record, FieldRecord):
+        return OrderedDict([
+            ('type', 'field'),
+            ('instance', record.instance),
+            ('register', record.register),
+            ('address', record.address),
+            ('field', record.field),
+            ('lsb', record.location.start),
+            ('msb', record.location.stop-1),
+            ('value', record.value),
+            ('enum', record.decoded),
+        ])
+    elif isinstance(record, RegisterRecord):
+        return OrderedDict([
+            ('type', 'register'),
+            ('instance', record.instance),
+            ('register', record.register),
+            ('address', record.address),
+            ('word', record.word),
+        ])
+    elif isinstance(record, UnmatchedRecord):
+        return OrderedDict([
+            ('type', 'unmatched'),
+            ('address', record.location.start),
+            ('size', len(record.location)),
+        ])
+
+class JSONLinesEmitter:
+    """write one JSON object per record"""
+
+    def __init__(self, sink):
+        self.sink = sink
+
+    def emit(self, records):
+        write = self.sink.write
+        dumps = json.JSONEncoder(ensure_ascii=False).encode
+        for record in records:
+            write(dumps(_record_row(record)))
+
+class CSVEmitter:
+    """write one CSV row per record, with a header before the first one"""
+
+    COLUMNS = ['type', 'instance', 'register', 'address', 'word', 'size',
+               'field', 'lsb', 'msb', 'value', 'enum']
+
+    def __init__(self, sink, *, header=True):
+        self.sink = sink
+        # the sink adds the line terminator itself
+        self.writer = csv.DictWriter(sink, self.COLUMNS, lineterminator='')
+        self.header = header
+
+    def emit(self, records):
+        if self.header:
+            self.writer.writeheader()
+            self.header = False
+        for record in records:
+            row = _record_row(record)
+            row['address'] = '0x{:08x}'.format(row['address'])
+            if 'word' in row:
+                row['word'] = '0x{:x}'.format(row['word'])
+            self.writer.writerow(row)
+
+EMITTERS = {
+    'text': TextEmitter,
+    'jsonl': JSONLinesEmitter,
+    'csv': CSVEmitter,
+}
@@ -0,0 +1,75 @@
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from operator import itemgetter
+
+from .decode import Decoder
+from .location import Location
+from .memory import MemorySlice
+from .output import CSVEmitter
+from .output import EMITTERS
+from .output import ListSink
+from .records import UnmatchedRecord
+
+# per worker process: the layout arguments and the decoder loaded for them
+_worker = None
+
+
+def split(decoder, slices):
+    """cut the slices at instance boundaries into shards sorted by address
+
+    Each shard is a (start, stop, data, word_size, swapped) tuple, data is
+    None for memory which is not covered by any instance.
+    """
+    shards = []
+    for ms in slices:
+        found = False
+        for region in ms.regions():
+            for instance in decoder.find_instances(region):
+                loc = instance.location & region
+                data = ms.read(loc.start, len(loc))
+                shards.append((loc.start, loc.stop, data, ms.word_size, ms.swapped))
+                found = True
+        if not found:
+            loc = ms.inner_loc
+            shards.append((loc.start, loc.stop, None, ms.word_size, ms.swapped))
+    shards.sort(key=itemgetter(0))
+    return shards
+
+def _decode_shard(args, shard):
+    global _worker
+    if _worker is None or _worker[0] != args:
+        layout, cache, format = args
+        sink = ListSink()
+        decoder = Decoder(layout, cache=cache, lazy=True, sink=sink, format=format)
+        if isinstance(decoder.emitter, CSVEmitter):
+            # the header is written once by the parent process
+            decoder.emitter = CSVEmitter(sink, header=False)
+        _worker = (args, decoder)
+    decoder = _worker[1]
+
+    start, stop, data, word_size, swapped = shard
+    if data is None:
+        records = [UnmatchedRecord(Location(start, stop))]
+    else:
+        ms = MemorySlice(start, swapped=swapped, word_size=word_size)
+        ms.write(start, data)
+        records = decoder.records(ms)
+    decoder.emitter.emit(records)
+    return decoder.sink.take()
+
+def decode(decoder, slices, *, jobs, format='text', cache=False, sink):
+    """decode the slices in a pool of worker processes
+
+    The output for all shards is written to the sink in address order.
+    """
+    shards = split(decoder, slices)
+    if not shards:
+        return
+    # emits the CSV header, if any
+    EMITTERS[format](sink).emit([])
+    args = (decoder.filename, cache, format)
+    chunksize = max(1, len(shards)//(jobs*4))
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        for text in executor.map(partial(_decode_shard, args), shards, chunksize=chunksize):
+            if text:
+                sink.write(text[:-1])
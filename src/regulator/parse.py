@@ -1,57 +1,160 @@
 import re
+import time
 
+from . import formats
 from .memory import MemorySlice
+from .output import PrintSink
+
+
+def read_blocks(stream, size=64*1024):
+    """yield lists of complete lines, reading the stream in large blocks
+
+    For text files with an underlying binary buffer, each block holds
+    whatever has arrived so far, up to size bytes, so that lines from a
+    pipe are not held back until the block is full.
+    """
+    read1 = getattr(getattr(stream, 'buffer', None), 'read1', None)
+    if read1 is None:
+        read, empty, newline = stream.read, '', '\n'
+    else:
+        read, empty, newline = read1, b'', b'\n'
+    rest = empty
+    while True:
+        block = read(size)
+        if not block:
+            break
+        lines = (rest+block).split(newline)
+        rest = lines.pop()
+        if not lines:
+            continue
+        if read1 is not None:
+            lines = [line.decode('utf-8', 'replace') for line in lines]
+        yield lines
+    if rest:
+        yield [rest if read1 is None else rest.decode('utf-8', 'replace')]
 
 
 class Parser:
+    """parse hex dumps into memory slices
+
+    The dump format is one of the names in formats.FORMATS, or None to
+    detect it from the first lines which hold data. Slices always hold
+    words of word_size bytes, whatever the width of the dumped words.
+    """
+
     MAP_MESSAGE = re.compile(r"^mapping offset (\S+) \(size (\S+)\)$")
 
-    def __init__(self):
+    def __init__(self, *, coalesce=False, sink=None, stats=None, format=None, word_size=4):
+        self.sink = PrintSink() if sink is None else sink
+        self.stats = stats
         self.map_base = 0x0
+        self.coalesce = coalesce
+        self.pending = None
+        self.auto = format is None
+        self.format = None if self.auto else formats.get(format)()
+        self.word_size = word_size
 
     def parse_map(self, line):
         m = self.MAP_MESSAGE.match(line)
         if not m:
             return False
         self.map_base = int(m.group(1), 16)
-        print('parser base set to 0x{:x}'.format(self.map_base))
+        self.sink.write('parser base set to 0x{:x}'.format(self.map_base))
         return True
 
+    def detect(self, lines):
+        """pick the format from the first lines, if it isn't known yet"""
+        if self.format is None:
+            cls = formats.detect(lines)
+            if cls is not None:
+                self.format = cls()
+
+    def redetect(self, line):
+        """switch to the format of a line the current format doesn't match
+
+        Return the parsed line, or None if it isn't a data line of any
+        format.
+        """
+        if not self.auto or not line.strip():
+            return None
+        cls = formats.detect([line])
+        if cls is None or isinstance(self.format, cls):
+            return None
+        self.format = cls()
+        self.sink.write('parser format changed to {}'.format(cls.name))
+        return self.format.parse(line)
+
     def parse_hex_line(self, line):
-        line = line.strip()
-        if not line:
-            return
-        if not ':' in line:
+        self.detect([line])
+        if self.format is None:
             return
-        addr, data = line.split(':', 1)
-        try:
-            addr = int(addr, 16)
-        except ValueError:
+        parsed = self.format.parse(line) or self.redetect(line)
+        if parsed is None:
             return
+        addr, data = parsed
         addr += self.map_base
-        data = data[:-16].split()
-        word_size = len(data[0])//2
-        slice = MemorySlice(addr, word_size=word_size)
-        for word in data:
-            assert len(word) == word_size * 2
-            slice[addr:addr+word_size] = word
-            addr += word_size
+        slice = MemorySlice(addr, word_size=self.word_size)
+        slice.write(addr, data)
         return slice
 
     def parse_lines(self, lines):
+        if self.stats is None:
+            return self._parse_lines(lines)
+        start = time.perf_counter()
+        lines = list(lines)
+        slices = self._parse_lines(lines)
+        self.stats.add('parse', time.perf_counter()-start)
+        self.stats.count('lines', len(lines))
+        return slices
+
+    def _parse_lines(self, lines):
         slices = []
+        if self.format is None:
+            lines = list(lines)
+            self.detect(lines)
+            if self.format is None:
+                for line in lines:
+                    self.parse_map(line)
+                return slices
+        parse = self.format.parse
+        word_size = self.word_size
         for line in lines:
             if self.parse_map(line):
                 continue
             else:
-                slice = self.parse_hex_line(line)
-                if slice:
+                parsed = parse(line)
+                if parsed is None:
+                    # the dump may continue in another format
+                    parsed = self.redetect(line)
+                    if parsed is None:
+                        continue
+                    parse = self.format.parse
+                addr, data = parsed
+                addr += self.map_base
+                slice = MemorySlice(addr, word_size=word_size)
+                slice.write(addr, data)
+                if not self.coalesce:
                     slices.append(slice)
+                elif self.pending is not None and self.pending.can_extend(slice):
+                    self.pending.extend(slice)
+                else:
+                    slices.extend(self.flush())
+                    self.pending = slice
         return slices
 
+    def flush(self):
+        """return the region collected so far when coalescing"""
+        if self.pending is None:
+            return []
+        pending, self.pending = self.pending, None
+        return [pending]
+
     def parse_dirty(self, text):
         lines = text.split('\n')
         if len(lines) < 3:
             return []
         lines = lines[1:-1]
-        return self.parse_lines(lines)
+        if self.auto:
+            # each selection may come from a different tool
+            self.format = None
+        return self.parse_lines(lines) + self.flush()
@@ -0,0 +1,33 @@
+import attr
+
+
+@attr.s(slots=True)
+class RegisterRecord:
+    instance = attr.ib()
+    register = attr.ib()
+    address = attr.ib()
+    word = attr.ib()
+    view = attr.ib(default=None, repr=False, cmp=False)
+    decoded = attr.ib(default=None, repr=False, cmp=False)
+
+@attr.s(slots=True)
+class FieldRecord:
+    instance = attr.ib()
+    register = attr.ib()
+    address = attr.ib()
+    field = attr.ib()
+    location = attr.ib()
+    value = attr.ib()
+    decoded = attr.ib(default=None)
+    template = attr.ib(default=None, repr=False, cmp=False)
+
+@attr.s(slots=True)
+class UnmatchedRecord:
+    location = attr.ib()
+
+@attr.s(slots=True)
+class DecodedWord:
+    """the decoded fields of a register word, their bits templates and rendered lines"""
+    fields = attr.ib()
+    templates = attr.ib()
+    lines = attr.ib(default=None)
@@ -0,0 +1,206 @@
+import asyncio
+import os
+import socket
+import struct
+import sys
+import threading
+
+from .decode import Decoder
+from .memory import MemorySlice
+from .output import EMITTERS
+from .output import ListSink
+from .output import NullSink
+from .parse import Parser
+
+# Each request starts with a header line
+#
+#   MODE FORMAT DUMP_FORMAT BASE WORD_SIZE LAYOUT
+#
+# MODE is 'hex' for a hex dump in DUMP_FORMAT ('-' to detect it) or
+# 'raw' for raw bytes, which are stored starting at BASE with the given
+# WORD_SIZE ('-' for hex dumps). The client then sends the dump and
+# shuts down its sending side. The server streams the decoded output
+# back in OUTPUT frames and ends with a single OK or ERROR frame, whose
+# payload is the error message.
+
+BLOCK_SIZE = 64*1024
+
+FRAME = struct.Struct('!cI')
+OUTPUT = b'D'
+OK = b'K'
+ERROR = b'E'
+
+
+class ServeError(Exception):
+    """the server failed to decode a request"""
+
+
+class Server:
+    """keep compiled layouts in memory and decode dumps sent by clients"""
+
+    def __init__(self, layouts=(), *, cache=True):
+        self.cache = cache
+        self.decoders = {}
+        self.lock = threading.Lock()
+        for layout in layouts:
+            self.decoder(layout)
+
+    def decoder(self, layout):
+        """return the decoder for a layout and its lock, reloading it if the file changed"""
+        layout = os.path.abspath(layout)
+        with self.lock:
+            mtime = os.stat(layout).st_mtime_ns
+            entry = self.decoders.get(layout)
+            if entry is None or entry[0] != mtime:
+                decoder = Decoder(layout, cache=self.cache, lazy=True, sink=NullSink())
+                entry = self.decoders[layout] = (mtime, decoder, threading.Lock())
+        return entry[1], entry[2]
+
+    @staticmethod
+    def decode(decoder, lock, emitter, slices):
+        # decoders memoize words, so requests for the same layout take turns
+        with lock:
+            for ms in slices:
+                emitter.emit(decoder.records(ms))
+
+    @staticmethod
+    def send(writer, kind, payload=b''):
+        writer.write(FRAME.pack(kind, len(payload)) + payload)
+
+    async def handle(self, reader, writer):
+        # loading and decoding run in the default executor, so that a slow
+        # request doesn't hold up the others
+        loop = asyncio.get_event_loop()
+        try:
+            header = (await reader.readline()).decode()
+            mode, format, dump_format, base, word_size, layout = header.rstrip('\n').split(' ', 5)
+            if format not in EMITTERS:
+                raise ValueError('unknown output format {!r}, use one of: {}'.format(
+                    format, ', '.join(sorted(EMITTERS))))
+            decoder, lock = await loop.run_in_executor(None, self.decoder, layout)
+            sink = ListSink()
+            emitter = EMITTERS[format](sink)
+            if mode == 'hex':
+                parser = Parser(
+                        coalesce=True, sink=sink if format == 'text' else NullSink(),
+                        format=None if dump_format == '-' else dump_format)
+                await self.handle_hex(reader, writer, decoder, lock, parser, emitter, sink)
+            elif mode == 'raw':
+                word_size = 4 if word_size == '-' else int(word_size, 0)
+                ms = MemorySlice(int(base, 0), word_size=word_size)
+                addr = ms.base
+                while True:
+                    data = await reader.read(BLOCK_SIZE)
+                    if not data:
+                        break
+                    ms.write(addr, data)
+                    addr += len(data)
+                if len(ms):
+                    await loop.run_in_executor(None, self.decode, decoder, lock, emitter, [ms])
+                self.send(writer, OUTPUT, sink.take().encode())
+            else:
+                raise ValueError('unknown mode {!r}'.format(mode))
+            self.send(writer, OK)
+        except Exception as e:
+            self.send(writer, ERROR, str(e).encode())
+        finally:
+            try:
+                await writer.drain()
+            except ConnectionError:
+                pass
+            writer.close()
+
+    async def handle_hex(self, reader, writer, decoder, lock, parser, emitter, sink):
+        loop = asyncio.get_event_loop()
+        rest = b''
+        while True:
+            block = await reader.read(BLOCK_SIZE)
+            if not block:
+                break
+            lines = (rest+block).split(b'\n')
+            rest = lines.pop()
+            slices = await loop.run_in_executor(None, parser.parse_lines, [
+                line.decode('utf-8', 'replace') for line in lines])
+            await loop.run_in_executor(None, self.decode, decoder, lock, emitter, slices)
+            self.send(writer, OUTPUT, sink.take().encode())
+            await writer.drain()
+        slices = parser.parse_lines([rest.decode('utf-8', 'replace')]) if rest else []
+        slices += parser.flush()
+        await loop.run_in_executor(None, self.decode, decoder, lock, emitter, slices)
+        self.send(writer, OUTPUT, sink.take().encode())
+
+    def run(self, path):
+        if os.path.exists(path):
+            os.unlink(path)
+        loop = asyncio.new_event_loop()
+        try:
+            loop.run_until_complete(
+                    asyncio.start_unix_server(self.handle, path=path))
+            print('listening on {}'.format(path))
+            sys.stdout.flush()
+            loop.run_forever()
+        finally:
+            loop.close()
+            if os.path.exists(path):
+                os.unlink(path)
+
+def connect(path):
+    """connect to a running server, return None if there is none"""
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+    except (FileNotFoundError, ConnectionRefusedError):
+        sock.close()
+        return None
+    return sock
+
+def _recv_exactly(sock, size):
+    chunks = []
+    while size:
+        data = sock.recv(min(size, BLOCK_SIZE))
+        if not data:
+            raise ServeError('the server closed the connection early')
+        chunks.append(data)
+        size -= len(data)
+    return b''.join(chunks)
+
+def request(sock, layout, source, target, *, format='text', dump_format=None, base=None,
+            word_size=None):
+    """send a dump read from the binary source, copy the output to target
+
+    Raises ServeError with the server's message if the request failed.
+    """
+    mode = 'hex' if base is None else 'raw'
+    header = '{} {} {} {} {} {}\n'.format(
+            mode, format,
+            '-' if dump_format is None else dump_format,
+            '-' if base is None else hex(base),
+            '-' if word_size is None else word_size,
+            os.path.abspath(layout))
+    def send():
+        try:
+            sock.sendall(header.encode())
+            while True:
+                block = source.read(BLOCK_SIZE)
+                if not block:
+                    break
+                sock.sendall(block)
+            sock.shutdown(socket.SHUT_WR)
+        except OSError:
+            # the server stopped reading, its reply tells why
+            pass
+
+    # send from a thread, so that output can be received while sending
+    with sock:
+        sender = threading.Thread(target=send, daemon=True)
+        sender.start()
+        while True:
+            kind, size = FRAME.unpack(_recv_exactly(sock, FRAME.size))
+            payload = _recv_exactly(sock, size)
+            if kind == OUTPUT:
+                target.write(payload)
+            elif kind == OK:
+                break
+            else:
+                raise ServeError(payload.decode('utf-8', 'replace'))
+        sender.join()
@@ -0,0 +1,47 @@
+import sys
+import time
+
+
+class Stats:
+    """cumulative time and counts for the decode stages
+
+    The render time is what remains of the decode time after lookup and
+    field extraction, so the hot paths only need a few counter updates.
+    """
+
+    STAGES = ('parse', 'lookup', 'extract', 'render')
+    COUNTERS = ('lines', 'slices', 'registers', 'fields', 'unmatched')
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.times = dict.fromkeys(self.STAGES + ('decode',), 0.0)
+        self.counts = dict.fromkeys(self.COUNTERS, 0)
+        self.memos = []
+
+    def add(self, stage, seconds):
+        self.times[stage] += seconds
+
+    def count(self, counter, n=1):
+        self.counts[counter] += n
+
+    def watch_memo(self, memo):
+        """include the counters of a decoder's memo in the summary"""
+        self.memos.append(memo)
+
+    def summary(self):
+        times = dict(self.times)
+        times['render'] = max(0.0, times.pop('decode') - times['lookup'] - times['extract'])
+        lines = ['regulator stats after {:.3f}s:'.format(time.perf_counter()-self.start)]
+        for stage in self.STAGES:
+            lines.append('  {:<10} {:10.3f}s'.format(stage, times[stage]))
+        for counter in self.COUNTERS:
+            lines.append('  {:<10} {:10}'.format(counter, self.counts[counter]))
+        for memo in self.memos:
+            lines.append('  memo       {hits} hits, {misses} misses, {evictions} evictions'.format(
+                **memo.stats()))
+        return '\n'.join(lines)
+
+    def report(self, stream=None):
+        stream = sys.stderr if stream is None else stream
+        stream.write(self.summary()+'\n')
+        stream.flush()
@@ -0,0 +1,190 @@
+import ctypes
+import ctypes.util
+import os
+import selectors
+import struct
+import time
+
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+
+_EVENT = struct.Struct('iIII')
+
+
+class Inotify:
+    """watch the directory of a file for changes to that file"""
+
+    MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+    def __init__(self, filename):
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        directory = os.path.dirname(os.path.abspath(filename))
+        wd = libc.inotify_add_watch(self.fd, os.fsencode(directory), self.MASK)
+        if wd < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, 'inotify_add_watch failed for {}'.format(directory))
+        self.name = os.fsencode(os.path.basename(filename))
+
+    def fileno(self):
+        return self.fd
+
+    def drain(self):
+        """consume all pending events, return whether one was for our file"""
+        relevant = False
+        while True:
+            try:
+                data = os.read(self.fd, 64*1024)
+            except BlockingIOError:
+                return relevant
+            pos = 0
+            while pos < len(data):
+                wd, mask, cookie, size = _EVENT.unpack_from(data, pos)
+                pos += _EVENT.size
+                name = data[pos:pos+size].rstrip(b'\0')
+                pos += size
+                if name == self.name:
+                    relevant = True
+
+    def close(self):
+        os.close(self.fd)
+
+class Tailer:
+    """follow a growing file, handling truncation and rotation
+
+    Changes are detected with inotify where available and by polling
+    otherwise. Bursts of changes are coalesced into a single read and
+    partial lines are kept in a bounded buffer.
+    """
+
+    def __init__(self, filename, *, debounce=0.05, interval=1.0,
+                 chunk_size=64*1024, batch_size=1024*1024, max_line=64*1024):
+        self.filename = filename
+        self.debounce = debounce
+        self.interval = interval
+        self.chunk_size = chunk_size
+        self.batch_size = batch_size
+        self.max_line = max_line
+        self.file = None
+        self.offset = 0
+        self.partial = []
+        self.partial_size = 0
+        self.skipping = False
+        self.more = False
+        self.open(at_end=True)
+
+    def open(self, *, at_end=False):
+        try:
+            self.file = open(self.filename, 'rb')
+        except FileNotFoundError:
+            self.file = None
+            return
+        if at_end:
+            self.file.seek(0, os.SEEK_END)
+        self.offset = self.file.tell()
+        self.reset()
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def reset(self):
+        self.partial = []
+        self.partial_size = 0
+        self.skipping = False
+
+    def read(self):
+        """read complete lines, up to about batch_size bytes at a time"""
+        lines = []
+        total = 0
+        self.more = False
+        while True:
+            chunk = self.file.read(self.chunk_size)
+            if not chunk:
+                break
+            total += len(chunk)
+            parts = chunk.split(b'\n')
+            if len(parts) > 1:
+                self.partial.append(parts[0])
+                if not self.skipping:
+                    lines.append(b''.join(self.partial))
+                self.skipping = False
+                lines.extend(parts[1:-1])
+                self.partial = [parts[-1]]
+                self.partial_size = len(parts[-1])
+            else:
+                self.partial.append(chunk)
+                self.partial_size += len(chunk)
+            if self.partial_size > self.max_line:
+                # drop overlong lines instead of buffering without limit
+                self.partial = []
+                self.partial_size = 0
+                self.skipping = True
+            if total >= self.batch_size:
+                self.more = True
+                break
+        self.offset = self.file.tell()
+        return [line.decode('utf-8', 'replace') for line in lines]
+
+    def check(self):
+        """read whatever changed since the last check"""
+        try:
+            st = os.stat(self.filename)
+        except FileNotFoundError:
+            st = None
+
+        lines = []
+        if self.file is not None:
+            fst = os.fstat(self.file.fileno())
+            if st is None or (st.st_dev, st.st_ino) != (fst.st_dev, fst.st_ino):
+                # rotated or deleted: finish the old file first
+                lines = self.read()
+                if self.more:
+                    return lines
+                self.close()
+            elif st.st_size < self.offset:
+                # truncated
+                self.file.seek(0)
+                self.offset = 0
+                self.reset()
+        if self.file is None:
+            if st is None:
+                return lines
+            self.open()
+        return lines + self.read()
+
+    def follow(self):
+        """yield batches of new lines, or an empty batch every interval"""
+        try:
+            inotify = Inotify(self.filename)
+        except (OSError, AttributeError, TypeError):
+            inotify = None
+
+        with selectors.DefaultSelector() as selector:
+            if inotify is not None:
+                selector.register(inotify, selectors.EVENT_READ)
+            try:
+                while True:
+                    if not self.more:
+                        if inotify is None:
+                            time.sleep(self.interval)
+                        elif selector.select(self.interval) and inotify.drain():
+                            # coalesce a burst of events into one read
+                            deadline = time.monotonic() + self.debounce*10
+                            while time.monotonic() < deadline:
+                                if not selector.select(self.debounce):
+                                    break
+                                inotify.drain()
+                    yield self.check()
+            finally:
+                if inotify is not None:
+                    inotify.close()
+                self.close()
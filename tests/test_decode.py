@@ -1,14 +1,21 @@
+import gc
 from io import StringIO
 from textwrap import dedent
 
 import pytest
 
+from regulator import decode
+from regulator import location
 from regulator.decode import Decoder
 from regulator.decode import Kind
 from regulator.location import Location
 from regulator.memory import MemorySlice
 from regulator.memory import MemoryView
+from regulator.output import ListSink
 from regulator.parse import Parser
+from regulator.records import FieldRecord
+from regulator.records import RegisterRecord
+from regulator.records import UnmatchedRecord
 
 
 @pytest.fixture
@@ -45,6 +52,10 @@ def test_load(decoder_mx6):
 
     assert d.find_cluster(0xdeadbeef) == (None, None)
 
+    instances = d.find_instances(Location(0x2600000, 0x2630001))
+    assert [i.name for i in instances] == ['IPU1_Base', 'IPU1_IC', 'IPU1_CSI0']
+    assert d.find_instances(Location(0x2700000, 0x2800000)) == []
+
     instance, cluster = d.find_cluster(0x2600000)
     assert instance.location == Location(0x2600000, 0x26000e8)
     assert cluster.find_register(0x00).name == 'IPUx_CONF'
@@ -52,6 +63,18 @@ def test_load(decoder_mx6):
     assert reg_type.name == 'IPUx_CONF'
     assert reg_type.find_field(28).name == 'CSI0_DATA_SOURCE'
 
+def test_load_cached(pytestconfig, tmpdir, monkeypatch):
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmpdir))
+    layout = str(pytestconfig.rootdir.join('layouts/imx6.yaml'))
+    compiled = Decoder(layout, cache=True)
+    assert len(tmpdir.join('regulator').listdir()) == 1
+
+    cached = Decoder(layout, cache=True)
+    assert cached.instances == compiled.instances
+    assert cached.find_instance(0x2630000).name == 'IPU1_CSI0'
+    instance, cluster = cached.find_cluster(0x2600000)
+    assert cluster.find_type(0x00).plan == compiled.clusters['IPU_Base'].types['IPUx_CONF'].plan
+
 def test_cluster_iterate_mx6(decoder_mx6):
     instance, cluster = decoder_mx6.find_cluster(0x2600000)
     assert instance.location == Location(0x2600000, 0x26000e8)
@@ -81,6 +104,22 @@ def test_cluster_iterate_mx23(decoder_mx23):
     assert regs[0][0].name == 'HW_RTC_STAT'
     assert regs[0][0].location == Location(0x10, 0x14)
 
+def test_cluster_find_mx28(decoder_mx28):
+    instance, cluster = decoder_mx28.find_cluster(0x80018000)
+    assert cluster.find_register(0x100).name == 'PINCTRL_MUXSEL0'
+    assert cluster.find_register(0x103).name == 'PINCTRL_MUXSEL0'
+    assert cluster.find_register(0x104) is None
+
+    idxs = cluster.find_registers(0x100, 0x120)
+    assert [cluster.registers[idx].name for idx in idxs] == ['PINCTRL_MUXSEL0', 'PINCTRL_MUXSEL1']
+    assert cluster.find_registers(0x104, 0x110) == []
+
+    # RSRVD2 overlaps RSRVD3, the first one in order wins
+    reg_type = cluster.types['PINCTRL_DRIVE18']
+    assert reg_type.find_field(19).name == 'RSRVD2'
+    assert reg_type.find_field(20).name == 'RSRVD2'
+    assert reg_type.find_field(31).name == 'RSRVD3'
+
 def test_decode_ms(decoder_mx6):
     ms = MemorySlice(0x2600000, word_size=4)
     ms[0x2600000:0x2600004] = '00000761'
@@ -130,3 +169,204 @@ def test_decode_mx28(decoder_mx28):
     print()
     decoder_mx28.decode(result[0])
     decoder_mx28.decode(result[1])
+
+def test_decode_fields(decoder_mx6):
+    ms = MemorySlice(0x2600000, word_size=4)
+    ms[0x2600000:0x2600004] = '10000761'
+
+    instance, cluster = decoder_mx6.find_cluster(0x2600000)
+    reg_type = cluster.find_type(0x00)
+    assert reg_type.plan[0][:4] == (Location(28), 'CSI0_DATA_SOURCE', 28, 0x1)
+
+    mv = MemoryView(ms, instance.location)
+    values = decoder_mx6.decode_fields(mv, reg_type)
+    assert values[0] == (Location(28), 'CSI0_DATA_SOURCE', 1, 'MCT (MIPI) is connected to CSI0')
+    assert values[1] == (Location(10), 'DMFC_EN', 1, None)
+    assert values[-1] == (Location(0), 'CSI0_EN', 1, None)
+
+def test_decode_region_mx28(decoder_mx28, capsys):
+    dump = """
+80018640: 00000001 00000000 00000000 00000000                ................
+80018650: 00000002 00000000 00000000 00000000                ................
+    """.strip().splitlines()
+    p = Parser(coalesce=True)
+    result = p.parse_lines(dump) + p.flush()
+    assert len(result) == 1
+
+    decoder_mx28.decode(result[0])
+    out, err = capsys.readouterr()
+    assert 'no instance found' not in out
+    assert '# PINCTRL_PULL BANK4' in out
+    assert '# PINCTRL_PULL2 ' in out
+
+def test_records_mx6(decoder_mx6):
+    ms = MemorySlice(0x2600000, word_size=4)
+    ms[0x2600000:0x2600004] = '00000761'
+    records = list(decoder_mx6.records(ms))
+    assert records[0] == RegisterRecord('IPU1_Base', 'IPUx_CONF', 0x2600000, 0x761)
+    assert records[1] == FieldRecord(
+            'IPU1_Base', 'IPUx_CONF', 0x2600000, 'CSI0_DATA_SOURCE', Location(28), 0,
+            'Parallel interface is connected to CSI0')
+    assert records[-1] == FieldRecord('IPU1_Base', 'IPUx_CONF', 0x2600000, 'CSI0_EN', Location(0), 1)
+
+    ms = MemorySlice(0x2700000, word_size=4)
+    ms[0x2700000:0x2700004] = '00000761'
+    assert list(decoder_mx6.records(ms)) == [UnmatchedRecord(Location(0x2700000, 0x2700004))]
+
+def test_decode_memo_mx6(pytestconfig):
+    layout = open(str(pytestconfig.rootdir.join('layouts/imx6.yaml')))
+    sink = ListSink()
+    decoder = Decoder(layout, sink=sink)
+    ms = MemorySlice(0x2600000, word_size=4)
+    ms[0x2600000:0x2600004] = '00000761'
+    decoder.decode(ms)
+    first = sink.take()
+    decoder.decode(ms)
+    assert sink.take() == first
+    assert decoder.memo.stats() == {'hits': 1, 'misses': 1, 'evictions': 0, 'entries': 1}
+
+    # the same type and value at another address only differs in the address column
+    ms = MemorySlice(0x2a00000, word_size=4)
+    ms[0x2a00000:0x2a00004] = '00000761'
+    decoder.decode(ms)
+    assert sink.take() == first.replace('02600000', '02a00000').replace('IPU1_Base', 'IPU2_Base')
+    assert decoder.memo.hits == 2
+
+def test_load_shared():
+    layout = StringIO(dedent("""
+        clusters:
+          C:
+            size: 0x8
+            types:
+              r32 A:
+                fields:
+                  u1 0:
+                    name: EN
+                    enum: {0: disabled, 1: enabled}
+                  u3 1…3: MODE
+              r32 B:
+                fields:
+                  u1 0:
+                    name: EN
+                    enum: {1: enabled, 0: disabled}
+                  u3 1…3: MODE
+            registers:
+              r32 0x0: A
+              r32 0x4: B
+        instances:
+          C 0x1000: C0
+    """))
+    decoder = Decoder(layout)
+    a = decoder.clusters['C'].types['A']
+    b = decoder.clusters['C'].types['B']
+    assert a.kind is b.kind
+    assert a.fields[0].kind is b.fields[0].kind
+    assert a.fields[1].location is b.fields[1].location
+    assert a.fields[0].enum is b.fields[0].enum
+    assert decoder.layout['clusters']['C']['types']['r32 B']['fields']['u1 0']['enum'] is a.fields[0].enum
+    assert not hasattr(a.fields[0], '__dict__')
+    assert not hasattr(a.fields[0].location, '__dict__')
+
+def test_compile_retry():
+    layout = StringIO(dedent("""
+        clusters:
+          C:
+            size: 0x4
+            types:
+              r32 A:
+                fields:
+                  u1 0:
+                    name: EN
+                    unknown: 1
+            registers:
+              r32 0x0: A
+        instances:
+          C 0x1000: C0
+    """))
+    decoder = Decoder(layout, lazy=True)
+    for _ in range(2):
+        with pytest.raises(TypeError):
+            decoder.clusters['C']
+    assert decoder.layout['clusters']['C']['types']['r32 A']['fields']['u1 0']['name'] == 'EN'
+
+def test_load_shared_released():
+    layout = dedent("""
+        clusters:
+          C:
+            size: 0x400
+            types:
+              r32 A:
+                fields:
+                  u1 0:
+                    name: EN
+                    enum: {0: released off, 1: released on}
+            registers:
+              r32 0x3f0: A
+        instances:
+          C 0x1000: C0
+    """)
+    enum = {0: 'released off', 1: 'released on'}
+    decoder = Decoder(StringIO(layout))
+    assert decode.intern_enum(enum) is decoder.clusters['C'].types['A'].fields[0].enum
+    assert (Location, '0x3f0', 4) in location._PARSED
+    # reloading a layout doesn't keep the enums of the previous one alive
+    decoder.load(StringIO(layout.replace('released on', 'released still on')))
+    gc.collect()
+    assert frozenset(enum.items()) not in decode._ENUMS
+    del decoder
+    gc.collect()
+    assert (Location, '0x3f0', 4) not in location._PARSED
+
+def test_cluster_shared_address():
+    layout = StringIO(dedent("""
+        clusters:
+          C:
+            size: 0x8
+            types:
+              r32 A:
+                fields:
+                  u1 0: EN
+              r32 B:
+                fields:
+                  u1 0: ACTIVE
+            registers:
+              r32 0x0: A
+              r32 0x00: B
+              r32 0x4: A
+        instances:
+          C 0x1000: C0
+    """))
+    decoder = Decoder(layout)
+    cluster = decoder.clusters['C']
+    assert cluster.find_register(0x2).name == 'A'
+    assert cluster.find_register(0x4).name == 'A'
+    assert [cluster.registers[idx].name for idx in cluster.find_registers(0x0, 0x4)] == ['A', 'B']
+
+@pytest.mark.parametrize('word_size', [1, 2, 4, 8])
+def test_decode_image_word_size(pytestconfig, word_size):
+    layout = open(str(pytestconfig.rootdir.join('layouts/imx23.yaml')))
+    sink = ListSink()
+    decoder = Decoder(layout, sink=sink)
+    data = bytes(range(0xf0, 0x100)) * 4
+    ms = MemorySlice.from_buffer(0x80040000, data, word_size=word_size)
+    records = list(decoder.records(ms))
+    assert records[0] == RegisterRecord('CLKCTRL', 'HW_CLKCTRL_PLLCTRL0', 0x80040000, 0xf3f2f1f0)
+    decoder.decode(ms)
+    assert sink.take().splitlines()[0] == (
+            '80040000: f3f2f1f0 -------- -------- -------- # CLKCTRL HW_CLKCTRL_PLLCTRL0')
+
+def test_decode_partial_register(pytestconfig):
+    layout = open(str(pytestconfig.rootdir.join('layouts/imx23.yaml')))
+    decoder = Decoder(layout)
+    # ends within HW_CLKCTRL_PLLCTRL1 at 0x10
+    ms = MemorySlice.from_buffer(0x80040000, bytes(18), word_size=4)
+    registers = [r.register for r in decoder.records(ms) if isinstance(r, RegisterRecord)]
+    assert registers == ['HW_CLKCTRL_PLLCTRL0']
+
+    p = Parser(coalesce=True)
+    result = p.parse_lines([
+        '80040000: 3b27 40ab 3010 e548 837d 762f b468 3ea2  ;\'@.0..H.}v/.h>.',
+        '80040010: c472                                     .r',
+    ]) + p.flush()
+    registers = [r.register for r in decoder.records(result[0]) if isinstance(r, RegisterRecord)]
+    assert registers == ['HW_CLKCTRL_PLLCTRL0']
@@ -135,3 +135,45 @@ def test_unknown_register_type(capsys):
     out, err = capsys.readouterr()
     assert "in register 'r32 0x00'" in err
     assert "in cluster 'IPU_Base'" in err
+
+def test_overlapping_instance(capsys):
+    with raises(ValueError, match="0x2600080…2600167 overlaps 0x2600000…26000e7"):
+        decoder_from_string("""
+            clusters:
+              IPU_Base:
+                size: 0xe8
+                word_size: 4
+                types:
+                  r32 IPUx_CONF:
+                    fields:
+                      u1 1: CSI0_EN
+                registers:
+                  r32 0x00: IPUx_CONF
+            instances:
+              IPU_Base 0x2600000: IPU1_Base
+              IPU_Base 0x2600080: IPU2_Base
+        """)
+    out, err = capsys.readouterr()
+    assert "in instance 'IPU2_Base'" in err
+
+def test_lazy_cluster(capsys):
+    d = Decoder(StringIO(textwrap.dedent("""
+        clusters:
+          IPU_Base:
+            size: 0xe8
+            word_size: 4
+            types:
+              r32 IPUx_CONF:
+                fields:
+                  g1 0: CSI0_EN
+            registers:
+              r32 0x00: IPUx_CONF
+        instances:
+          IPU_Base 0x2600000: IPU1_Base
+    """)), lazy=True)
+    assert d.find_instance(0x2600000).name == 'IPU1_Base'
+    with raises(ValueError, match="unknown kind g1"):
+        d.find_cluster(0x2600000)
+    out, err = capsys.readouterr()
+    assert "in field 'g1 0'" in err
+    assert "in cluster 'IPU_Base'" in err
@@ -0,0 +1,62 @@
+from io import StringIO
+
+from regulator import diff
+from regulator.decode import Decoder
+from regulator.location import Location
+from regulator.memory import MemorySlice
+from regulator.output import BufferedSink
+
+OLD = """
+->map 0x2600000 0x200000
+mapping offset 0x02600000 (size 0x200000)
+->md 0x0 0x100
+00000000: 00000761 00000000 00000000 00000000 a...............
+00030000: 04008b00 01df02ef 01df02ef 00000000 ................
+"""
+
+NEW = """
+->map 0x2600000 0x200000
+mapping offset 0x02600000 (size 0x200000)
+->md 0x0 0x100
+00000000: 10000760 00000006 00000000 00000000 a...............
+00000010: 00000000 00000000 00000000 00000000 ................
+"""
+
+
+def test_load():
+    ms = diff.load(StringIO(OLD))
+    assert ms.regions() == [Location(0x2600000, 0x2600010), Location(0x2630000, 0x2630010)]
+    assert diff.load(StringIO("nothing here")) is None
+
+def test_common_regions():
+    a = diff.load(StringIO(OLD))
+    b = diff.load(StringIO(NEW))
+    assert diff.common_regions(a, b) == [Location(0x2600000, 0x2600010)]
+
+def test_diff(pytestconfig):
+    decoder = Decoder(open(str(pytestconfig.rootdir.join('layouts/imx6.yaml'))))
+    a = diff.load(StringIO(OLD))
+    b = diff.load(StringIO(NEW))
+    stream = StringIO()
+    sink = BufferedSink(stream)
+    diff.render(diff.changes(decoder, a, b), sink)
+    sink.flush()
+    assert stream.getvalue().splitlines() == [
+        '02600000: 00000761 -> 10000760 # IPU1_Base IPUx_CONF',
+        '02600000:   CSI0_DATA_SOURCE: 0 = Parallel interface is connected to CSI0 -> '
+        '1 = MCT (MIPI) is connected to CSI0',
+        '02600000:   CSI0_EN: 1 -> 0',
+        '02600004: 00000000 -> 00000006 # IPU1_Base IPUx_SISG_CTRL0',
+        '02600004:   NO_VSYNC_2_STRT_CNT: 0 -> 3',
+    ]
+
+def test_diff_byte_order(pytestconfig):
+    decoder = Decoder(open(str(pytestconfig.rootdir.join('layouts/imx6.yaml'))))
+    a = diff.load(StringIO(OLD))
+    # the same values, stored big endian
+    b = MemorySlice(0x2600000, swapped=False, word_size=4)
+    b.write(0x2600000, bytes.fromhex('00000761000000060000000000000000'))
+    changes = list(diff.changes(decoder, a, b))
+    assert [(address, old, new) for _, _, address, old, new, _ in changes] == [
+        (0x2600004, 0x0, 0x6),
+    ]
@@ -0,0 +1,108 @@
+import os
+from io import StringIO
+
+from regulator import history
+from regulator.decode import Decoder
+from regulator.output import BufferedSink
+from regulator.output import NullSink
+from regulator.parse import Parser
+
+DUMP = """
+->map 0x2600000 0x200000
+mapping offset 0x02600000 (size 0x200000)
+->md 0x0 0x100
+00000000: {:08x} 00000000 00000000 00000000 a...............
+"""
+
+
+def parse(text):
+    return Parser(coalesce=True, sink=NullSink()).parse_dirty(text)
+
+def test_store(tmpdir):
+    store = history.Store(str(tmpdir))
+    for i in range(10):
+        store.append(100.0+i, 0x1000, 4, i)
+    store.append(105.5, 0x1004, 2, 0xffff)
+    assert [list(column) for column in store.series(0x1000, 4)] == [[], []]
+    store.flush()
+    # the clock goes back
+    store.append(90.0, 0x1000, 4, 10)
+    store.append(103.0, 0x1000, 4, 11)
+    store.flush()
+    times, words = store.series(0x1000, 4)
+    assert list(times) == [100.0+i for i in range(10)] + [90.0, 103.0]
+    assert list(words) == list(range(12))
+    times, words = store.series(0x1000, 4, since=102.5, until=105.0)
+    assert list(times) == [103.0, 104.0, 105.0, 103.0]
+    assert list(words) == [3, 4, 5, 11]
+    times, words = store.series(0x1000, 4, until=95.0)
+    assert list(times) == [90.0]
+    assert list(words) == [10]
+    assert list(store.series(0x1000, 4, since=200.0)[1]) == []
+    assert list(store.series(0x1004, 2)[1]) == [0xffff]
+    assert list(store.series(0x2000, 4)[1]) == []
+
+def test_history(tmpdir, pytestconfig):
+    decoder = Decoder(open(str(pytestconfig.rootdir.join('layouts/imx6.yaml'))))
+    store = history.Store(str(tmpdir))
+    for i, word in enumerate([0x761, 0x761, 0x10000760]):
+        for ms in parse(DUMP.format(word)):
+            assert store.record(decoder, ms, 1000.0+i) == 2
+    store.flush()
+
+    assert history.resolve(decoder, 'IPUx_UNKNOWN') == []
+    assert len(history.resolve(decoder, 'IPUx_CONF')) == 2
+    (match, ) = history.resolve(decoder, 'IPU1_Base.IPUx_CONF')
+    samples = list(history.history(store, *match))
+    assert [(t, a, v) for t, a, v, _ in samples] == [
+        (1000.0, 0x2600000, 0x761),
+        (1001.0, 0x2600000, 0x761),
+        (1002.0, 0x2600000, 0x10000760),
+    ]
+    (match, ) = history.resolve(decoder, 'IPU1_Base.IPUx_CONF.CSI0_DATA_SOURCE')
+    samples = list(history.history(store, *match, changes=True))
+    assert [(t, v, d) for t, _, v, d in samples] == [
+        (1000.0, 0, 'Parallel interface is connected to CSI0'),
+        (1002.0, 1, 'MCT (MIPI) is connected to CSI0'),
+    ]
+    (match, ) = history.resolve(decoder, 'IPU1_Base.IPUx_CONF.CSI0_EN')
+    stream = StringIO()
+    sink = BufferedSink(stream)
+    instance, reg, _, field = match
+    history.render(history.history(store, *match, since=1001.0), instance, reg, field, sink)
+    sink.flush()
+    lines = stream.getvalue().splitlines()
+    assert [line.split(' ', 2)[2] for line in lines] == [
+        '02600000: CSI0_EN: 1 # IPU1_Base IPUx_CONF',
+        '02600000: CSI0_EN: 0 # IPU1_Base IPUx_CONF',
+    ]
+
+def test_store_reopen(tmpdir):
+    store = history.Store(str(tmpdir))
+    store.append(100.0, 0x1000, 4, 1)
+    store.append(200.0, 0x1000, 4, 2)
+    store.flush()
+    time_path, word_path = store.column_paths(0x1000, 4)
+    # a crash after appending the words, but before the times
+    with open(word_path, 'ab') as f:
+        f.write(b'\x03\x00\x00\x00')
+    with open(time_path, 'ab') as f:
+        f.write(b'\x00\x00')
+
+    # a later run with an earlier clock
+    store = history.Store(str(tmpdir))
+    store.append(150.0, 0x1000, 4, 4)
+    store.append(300.0, 0x1000, 4, 5)
+    store.flush()
+    times, words = store.series(0x1000, 4)
+    assert list(times) == [100.0, 200.0, 150.0, 300.0]
+    assert list(words) == [1, 2, 4, 5]
+    times, words = store.series(0x1000, 4, since=150.0, until=199.0)
+    assert list(times) == [150.0]
+    assert list(words) == [4]
+    times, words = store.series(0x1000, 4, since=160.0)
+    assert list(times) == [200.0, 300.0]
+    assert list(words) == [2, 5]
+
+    os.unlink(word_path)
+    assert [list(column) for column in store.series(0x1000, 4)] == [[], []]
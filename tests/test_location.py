@@ -5,6 +5,7 @@ from hypothesis.strategies import integers
 from pytest import raises
 
 from regulator.location import Location
+from regulator.location import LocationIndex
 
 
 def test_location():
@@ -64,6 +65,32 @@ def test_range():
             Location(12, 16),
     ]
 
+def test_index():
+    index = LocationIndex([Location(0, 4), Location(4, 8), Location(0x10, 0x14)])
+    assert len(index) == 3
+    assert index.find(0) == 0
+    assert index.find(7) == 1
+    assert index.find(8) is None
+    assert index.find(0x13) == 2
+    assert index.find(-1) is None
+    assert index.overlapping(2, 0x11) == [0, 1, 2]
+    assert index.overlapping(8, 0x10) == []
+    assert list(index.starting(2, 0x11)) == [1, 2]
+
+    with raises(ValueError, match="0x6…9 overlaps 0x4…7"):
+        index = LocationIndex([Location(4, 8), Location(6, 10)])
+
+    with raises(ValueError, match="0x2…3 added out of order"):
+        index = LocationIndex([Location(4, 8), Location(2, 4)])
+
+def test_index_overlap():
+    index = LocationIndex([Location(0, 8), Location(2, 4), Location(6, 10)], overlap=True)
+    assert index.find(3) == 0
+    assert index.find(9) == 2
+    assert index.find(10) is None
+    assert index.overlapping(3, 7) == [0, 1, 2]
+    assert index.overlapping(8, 9) == [2]
+
 @given(start=integers())
 def test_start(start):
     assert Location(start).start == start
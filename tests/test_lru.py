@@ -0,0 +1,23 @@
+from regulator.lru import LRUCache
+
+
+def test_lru():
+    lru = LRUCache(2)
+    assert lru.get('a') is None
+    lru.put('a', 1)
+    lru.put('b', 2)
+    assert lru.get('a') == 1
+    # 'b' is now the least recently used entry
+    lru.put('c', 3)
+    assert 'b' not in lru
+    assert len(lru) == 2
+    assert lru.stats() == {'hits': 1, 'misses': 1, 'evictions': 1, 'entries': 2}
+
+    lru.clear()
+    assert len(lru) == 0
+
+def test_lru_disabled():
+    lru = LRUCache(0)
+    assert lru.put('a', 1) == 1
+    assert lru.get('a') is None
+    assert len(lru) == 0
@@ -1,6 +1,8 @@
 from regulator.location import Location
+from regulator.memory import MemoryImage
 from regulator.memory import MemorySlice
 from regulator.memory import MemoryView
+from regulator.memory import bits_template
 
 
 def test_slice():
@@ -39,3 +41,105 @@ def test_view():
     word_bits = mv.get_word_bits(0)
     assert word_bits == '11011110101011011011111011101111'
     assert mv.dump_bits(Location(4, 12)) == '00001000:     beef = ...._...._...._...._...._1110_1110_....'
+
+def test_image():
+    mi = MemoryImage()
+    mi.write(0xffe, b'\x01\x02\x03\x04')
+    assert len(mi.pages) == 2
+    assert mi.read(0xffc, 8) == b'\x00\x00\x01\x02\x03\x04\x00\x00'
+    assert mi[0x1000] == 0x03
+    assert mi.is_present(0xffe, 4)
+    assert not mi.is_present(0xffd, 2)
+    assert mi.regions() == [Location(0xffe, 0x1002)]
+
+    mi.write(0x1002, b'\x05')
+    mi.write(0x2000, b'\x06')
+    assert mi.regions() == [Location(0xffe, 0x1003), Location(0x2000)]
+
+def test_image_sparse():
+    mi = MemoryImage()
+    mi.write(0x80000000, b'\xde\xad')
+    mi.write(0x7ffff0000000, b'\xbe\xef')
+    assert len(mi.pages) == 2
+    assert mi.read(0x7ffff0000000, 2) == b'\xbe\xef'
+    assert mi.regions() == [Location(0x80000000, 0x80000002), Location(0x7ffff0000000, 0x7ffff0000002)]
+
+def test_slice_sparse():
+    ms = MemorySlice(0x80000000, word_size=4)
+    ms[0x80000000:0x80000004] = 'deadbeef'
+    ms[0x180000000:0x180000004] = '00112233'
+    assert len(ms) == 0x100000004
+    assert len(ms.image.pages) == 2
+    assert ms[0x180000000:0x180000004] == '00112233'
+    assert ms.regions() == [Location(0x80000000, 0x80000004), Location(0x180000000, 0x180000004)]
+    assert str(ms) == '80000000: deadbeef\n180000000: 00112233'
+
+def test_view_nested():
+    ms = MemorySlice(0x1000, word_size=4)
+    ms[0x1000:0x1004] = 'deadbeef'
+    ms[0x1004:0x1008] = '00112233'
+    mv = MemoryView(ms, Location(0x1000, 0x1008))
+    reg_mv = MemoryView(mv, Location(4, 8))
+    assert len(reg_mv) == 4
+    assert reg_mv.map(0) == 0x1004
+    assert reg_mv[0] == 0x33
+    assert reg_mv.get_value(0) == 0x00112233
+    assert reg_mv.get_word(0) == [0x00, 0x11, 0x22, 0x33]
+    assert bytes(reg_mv.get_bytes(0, 4)) == b'\x33\x22\x11\x00'
+
+def test_view_big_endian():
+    ms = MemorySlice(0x1000, swapped=False, word_size=4)
+    ms[0x1000:0x1004] = 'deadbeef'
+    mv = MemoryView(ms, Location(0x1000, 0x1004))
+    assert mv[0] == 0xde
+    assert mv.get_value(0) == 0xdeadbeef
+    assert mv.get_word_bits(0) == '11011110101011011011111011101111'
+
+def test_slice_from_buffer():
+    data = bytearray(b'\xef\xbe\xad\xde\x33\x22\x11\x00')
+    ms = MemorySlice.from_buffer(0x1000, data, word_size=4)
+    assert len(ms) == 8
+    assert ms.regions() == [Location(0x1000, 0x1008)]
+    assert ms[0x1004:0x1008] == '00112233'
+    assert ms.image.read(0xffe, 4) == b'\x00\x00\xef\xbe'
+    assert ms.image.is_present(0x1004, 4)
+    assert not ms.image.is_present(0x1006, 4)
+    mv = MemoryView(ms, Location(0x1004, 0x1008))
+    assert mv.get_value(0) == 0x00112233
+    # views share the buffer instead of copying it
+    data[4] = 0x44
+    assert mv.get_value(0) == 0x00112244
+    assert str(ms) == '00001000: deadbeef 00112244'
+    ms.image.release()
+
+def test_bits_template():
+    template = bits_template(Location(4, 12), 4)
+    assert template == bits_template(Location(4, 12), 4)
+    assert template.head == '...._...._...._...._...._'
+    assert template.tail == '_....'
+    assert template.columns == ('', '    ', slice(0, 4))
+    assert template.swapped_columns == ('    ', '', slice(4, 8))
+
+    ms = MemorySlice(0x1000, word_size=4)
+    ms[0x1000:0x1004] = 'deadbeef'
+    mv = MemoryView(ms, Location(0x1000, 0x1004))
+    assert mv.dump_bits(Location(31)) == '00001000: de       = 1..._...._...._...._...._...._...._....'
+    assert mv.dump_bits(Location(0, 32)) == '00001000: deadbeef = 1101_1110_1010_1101_1011_1110_1110_1111'
+
+def test_view_dump():
+    ms = MemorySlice(0x100c, word_size=4)
+    ms[0x100c:0x1010] = 'deadbeef'
+    ms[0x1010:0x1014] = '00112233'
+    mv = MemoryView(ms, Location(0x100c, 0x1014))
+    assert mv.dump() == (
+        '00001000: -------- -------- -------- deadbeef\n'
+        '00001010: 00112233 -------- -------- --------')
+    # bytes of partially covered words
+    assert MemoryView(mv, Location(1, 6)).dump() == (
+        '00001000: -------- -------- -------- deadbe--\n'
+        '00001010: ----2233 -------- -------- --------')
+
+    ms = MemorySlice(0x1000, swapped=False, word_size=2)
+    ms[0x1000:0x1002] = 'dead'
+    mv = MemoryView(ms, Location(0x1000, 0x1001))
+    assert mv.dump() == '00001000: de-- ---- ---- ---- ---- ---- ---- ----'
@@ -0,0 +1,65 @@
+from io import StringIO
+
+from regulator.location import Location
+from regulator.output import BufferedSink
+from regulator.output import CSVEmitter
+from regulator.output import JSONLinesEmitter
+from regulator.output import PrintSink
+from regulator.records import FieldRecord
+from regulator.records import RegisterRecord
+from regulator.records import UnmatchedRecord
+
+RECORDS = [
+    RegisterRecord('IPU1_Base', 'IPUx_CONF', 0x2600000, 0x761),
+    FieldRecord('IPU1_Base', 'IPUx_CONF', 0x2600000, 'NO_VSYNC_2_STRT_CNT', Location(1, 4), 0, 'zero'),
+    UnmatchedRecord(Location(0x2700000, 0x2700010)),
+]
+
+
+def test_print_sink(capsys):
+    sink = PrintSink()
+    sink.write('foo')
+    sink.write('')
+    out, err = capsys.readouterr()
+    assert out == 'foo\n\n'
+
+def test_buffered_sink():
+    stream = StringIO()
+    sink = BufferedSink(stream, size=8)
+    sink.write('foo')
+    assert stream.getvalue() == ''
+    sink.write('bar')
+    assert stream.getvalue() == 'foo\nbar\n'
+    sink.write('baz')
+    sink.flush()
+    assert stream.getvalue() == 'foo\nbar\nbaz\n'
+    sink.flush()
+    assert stream.getvalue() == 'foo\nbar\nbaz\n'
+
+def test_jsonl_emitter():
+    stream = StringIO()
+    sink = BufferedSink(stream)
+    JSONLinesEmitter(sink).emit(RECORDS)
+    sink.flush()
+    assert stream.getvalue().splitlines() == [
+        '{"type": "register", "instance": "IPU1_Base", "register": "IPUx_CONF", '
+        '"address": 39845888, "word": 1889}',
+        '{"type": "field", "instance": "IPU1_Base", "register": "IPUx_CONF", '
+        '"address": 39845888, "field": "NO_VSYNC_2_STRT_CNT", "lsb": 1, "msb": 3, '
+        '"value": 0, "enum": "zero"}',
+        '{"type": "unmatched", "address": 40894464, "size": 16}',
+    ]
+
+def test_csv_emitter():
+    stream = StringIO()
+    sink = BufferedSink(stream)
+    emitter = CSVEmitter(sink)
+    emitter.emit(RECORDS[:1])
+    emitter.emit(RECORDS[1:])
+    sink.flush()
+    assert stream.getvalue().splitlines() == [
+        'type,instance,register,address,word,size,field,lsb,msb,value,enum',
+        'register,IPU1_Base,IPUx_CONF,0x02600000,0x761,,,,,,',
+        'field,IPU1_Base,IPUx_CONF,0x02600000,,,NO_VSYNC_2_STRT_CNT,1,3,0,zero',
+        'unmatched,,,0x02700000,,16,,,,,',
+    ]
@@ -0,0 +1,50 @@
+from io import StringIO
+
+from regulator import parallel
+from regulator.decode import Decoder
+from regulator.output import BufferedSink
+from regulator.parse import Parser
+
+DUMP = """
+80018640: 00000001 00000000 00000000 00000000                ................
+80018650: 00000002 00000000 00000000 00000000                ................
+80018670: 00000000 00000000 00000000 00000000                ................
+80019a40: 00000003 00000000 00000000 00000000                ................
+""".strip().splitlines()
+
+
+def test_split(pytestconfig):
+    layout = str(pytestconfig.rootdir.join('layouts/imx28.yaml'))
+    decoder = Decoder(layout, lazy=True)
+    p = Parser(coalesce=True)
+    slices = p.parse_lines(reversed(DUMP)) + p.flush()
+
+    shards = parallel.split(decoder, slices)
+    assert [(start, stop) for start, stop, _, _, _ in shards] == [
+        (0x80018640, 0x80018650),
+        (0x80018650, 0x80018660),
+        (0x80018670, 0x80018680),
+        (0x80019a40, 0x80019a50),
+    ]
+    assert shards[0][2] == b'\x01' + bytes(15)
+    assert shards[2][2] is None
+
+def test_decode(pytestconfig):
+    layout = str(pytestconfig.rootdir.join('layouts/imx28.yaml'))
+
+    serial = StringIO()
+    sink = BufferedSink(serial)
+    decoder = Decoder(layout, lazy=True, sink=sink)
+    p = Parser(coalesce=True)
+    for ms in p.parse_lines(DUMP) + p.flush():
+        decoder.decode(ms)
+    sink.flush()
+
+    pooled = StringIO()
+    sink = BufferedSink(pooled)
+    p = Parser(coalesce=True)
+    parallel.decode(decoder, p.parse_lines(DUMP) + p.flush(), jobs=2, sink=sink)
+    sink.flush()
+
+    assert 'no instance found' in pooled.getvalue()
+    assert pooled.getvalue() == serial.getvalue()
@@ -1,4 +1,9 @@
+import os
+from io import StringIO
+
+from regulator.output import ListSink
 from regulator.parse import Parser
+from regulator.parse import read_blocks
 
 
 def test_parse_hex_line():
@@ -55,3 +60,154 @@ mapping offset 0x02600000 (size 0x200000)
     ms = result[0]
     assert ms.base == 0x2630000
     assert ms[0x2630004:0x2630008] == '01df02ef'
+
+def test_parse_coalesce():
+    p = Parser(coalesce=True)
+    result = p.parse_lines([
+        "f1022100: 00000000 00000011 00000001 03330007                ..............3.",
+        "f1022110: 00000400 00000300 00000100 00000000                ................",
+    ])
+    assert result == []
+    result = p.parse_lines([
+        "f1022120: 00000001 00125924 00000000 0000003f                ....$Y......?...",
+        "f1022200: 00000000 00000000 00000000 00000000                ................",
+    ])
+    assert len(result) == 1
+    ms = result[0]
+    assert ms.base == 0xf1022100
+    assert len(ms) == 0x30
+    assert ms[0xf1022124:0xf1022128] == '00125924'
+
+    result = p.flush()
+    assert len(result) == 1
+    assert result[0].base == 0xf1022200
+    assert len(result[0]) == 0x10
+    assert p.flush() == []
+
+def test_parse_dirty_coalesce():
+    p = Parser(coalesce=True)
+    dump = """
+~ # memtool md 0xf1022100
+f1022100: 00000000 00000011 00000001 03330007                ..............3.
+f1022110: 00000400 00000300 00000100 00000000                ................
+f1022120: 00000001 00125924 00000000 0000003f                ....$Y......?...
+    """
+    result = p.parse_dirty(dump)
+    assert len(result) == 1
+    assert result[0].inner_loc.hex() == '0xf1022100…f102212f'
+
+def test_read_blocks():
+    stream = StringIO("line 1\nline 2\nline 3")
+    assert list(read_blocks(stream, size=10)) == [['line 1'], ['line 2'], ['line 3']]
+    stream = StringIO("line 1\nline 2\n")
+    assert list(read_blocks(stream)) == [['line 1', 'line 2']]
+
+def test_parse_uboot_md_w():
+    p = Parser()
+    result = p.parse_lines([
+        "80018000: b1f5 2265 584a 91b7 6adf d8f1 3e30 cd61    ..e\"JX...j..0>a.",
+    ])
+    assert p.format.name == 'md'
+    ms = result[0]
+    assert ms.word_size == 4
+    assert ms[0x80018000:0x80018004] == '2265b1f5'
+    assert ms[0x8001800c:0x80018010] == 'cd613e30'
+
+def test_parse_uboot_md_b():
+    p = Parser()
+    result = p.parse_lines([
+        "80018000: f5 b1 65 22 4a 58 b7 91 df 6a f1 d8 30 3e 61 cd    ..e\"JX...j..0>a.",
+    ])
+    assert p.format.name == 'md'
+    assert result[0][0x80018004:0x80018008] == '91b7584a'
+
+def test_parse_hexdump():
+    p = Parser()
+    result = p.parse_lines([
+        "80018000  f5 b1 65 22 4a 58 b7 91  df 6a f1 d8 30 3e 61 cd  |..e\"JX...j..0>a.|",
+        "*",
+        "80018030  00 00 00 00                                       |....|",
+        "80018034",
+    ])
+    assert p.format.name == 'hexdump'
+    assert [len(ms) for ms in result] == [0x10, 0x24]
+    assert result[1].base == 0x80018010
+    assert result[1][0x80018020:0x80018024] == '2265b1f5'
+    assert result[1][0x80018030:0x80018034] == '00000000'
+
+def test_parse_xxd():
+    p = Parser(coalesce=True)
+    result = p.parse_lines([
+        "00000000: f5b1 6522 4a58 b791 df6a f1d8 303e 61cd  ..e\"JX...j..0>a.",
+        "00000010: 0100 0000                                ....",
+    ]) + p.flush()
+    assert p.format.name == 'xxd'
+    ms = result[0]
+    assert len(ms) == 0x14
+    assert ms[0x0:0x4] == '2265b1f5'
+    assert ms[0x10:0x14] == '00000001'
+
+def test_parse_openocd():
+    p = Parser()
+    result = p.parse_lines([
+        "> mdw 0x80018000 4",
+        "0x80018000: 2265b1f5 91b7584a d8f16adf cd613e30 ",
+    ])
+    assert p.format.name == 'openocd'
+    assert len(result) == 1
+    assert result[0][0x80018008:0x8001800c] == 'd8f16adf'
+
+def test_parse_devmem2():
+    p = Parser()
+    result = p.parse_dirty("""
+/dev/mem opened.
+Memory mapped at address 0xb6f9e000.
+Value at address 0x80018000 (0xb6f9e000): 0x2265B1F5
+    """)
+    assert p.format.name == 'devmem2'
+    assert len(result) == 1
+    assert str(result[0]) == '80018000: 2265b1f5'
+
+def test_parse_format_fixed():
+    p = Parser(format='md')
+    result = p.parse_lines([
+        "00000000: f5b1 6522 4a58 b791 df6a f1d8 303e 61cd  ..e\"JX...j..0>a.",
+    ])
+    assert result[0][0x0:0x4] == '6522f5b1'
+
+def test_read_blocks_pipe():
+    # lines are passed on as they arrive, without waiting for a full block
+    r, w = os.pipe()
+    with open(r, 'r', encoding='utf-8') as stream, open(w, 'wb') as writer:
+        blocks = read_blocks(stream)
+        writer.write(b"line 1\nline 2\nli")
+        writer.flush()
+        assert next(blocks) == ['line 1', 'line 2']
+        writer.write(b"\xc3\xa4")
+        writer.close()
+        assert list(blocks) == [['li\xe4']]
+
+def test_parse_memedit_hex_ascii():
+    # an ASCII column which looks like another word
+    p = Parser()
+    ms = p.parse_hex_line("00000000: 64636261 66656463 abcdefab........")
+    assert len(ms) == 8
+    ms = p.parse_hex_line("00000000: 64636261 66656463 61626364 abcdefabdcbaabcd")
+    assert len(ms) == 12
+
+def test_parse_format_change():
+    p = Parser(sink=ListSink())
+    # like a log which starts with a devmem2 read
+    result = p.parse_lines([
+        "Value at address 0x80018000 (0xb6f9e000): 0x2265B1F5",
+    ])
+    assert p.format.name == 'devmem2'
+    result += p.parse_lines([
+        "80018010: 00000001 00000002 00000003 00000004    ................",
+        "80018020: 00000005 00000006 00000007 00000008    ................",
+    ])
+    assert p.format.name == 'md'
+    assert [ms.base for ms in result] == [0x80018000, 0x80018010, 0x80018020]
+    assert p.sink.take() == 'parser format changed to md\n'
+    assert p.parse_hex_line("Value at address 0x80018004 (0xb6f9e004): 0x00000001").base == 0x80018004
+    assert p.format.name == 'devmem2'
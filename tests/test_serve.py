@@ -0,0 +1,74 @@
+import asyncio
+import os
+import socket
+import tempfile
+import threading
+from io import BytesIO
+
+import pytest
+
+from regulator import serve
+
+DUMP = b"""
+80018640: 00000001 00000000 00000000 00000000                ................
+80018650: 00000002 00000000 00000000 00000000                ................
+""".lstrip()
+
+
+@pytest.fixture
+def server(pytestconfig):
+    layout = str(pytestconfig.rootdir.join('layouts/imx28.yaml'))
+    path = os.path.join(tempfile.mkdtemp(), 'socket')
+    loop = asyncio.new_event_loop()
+    s = serve.Server([layout], cache=False)
+    loop.run_until_complete(asyncio.start_unix_server(s.handle, path=path))
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    yield layout, path
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
+    os.unlink(path)
+
+def test_serve_hex(server):
+    layout, path = server
+    out = BytesIO()
+    serve.request(serve.connect(path), layout, BytesIO(DUMP), out)
+    lines = out.getvalue().decode().splitlines()
+    assert lines[0] == '80018640: 00000001 -------- -------- -------- # PINCTRL_PULL BANK4'
+    assert '80018650: 00000002 -------- -------- -------- # PINCTRL_PULL2 BANK5' in lines
+
+def test_serve_raw(server):
+    layout, path = server
+    out = BytesIO()
+    serve.request(serve.connect(path), layout, BytesIO(b'\x02\x00\x00\x00'), out,
+                  format='jsonl', base=0x80018650, word_size=4)
+    lines = out.getvalue().decode().splitlines()
+    assert lines[0] == ('{"type": "register", "instance": "PINCTRL_PULL2", "register": "BANK5", '
+                        '"address": 2147583568, "word": 2}')
+
+def test_serve_error(server):
+    layout, path = server
+    out = BytesIO()
+    with pytest.raises(serve.ServeError) as excinfo:
+        serve.request(serve.connect(path), layout, BytesIO(DUMP), out, format='xml')
+    assert str(excinfo.value) == "unknown output format 'xml', use one of: csv, jsonl, text"
+    assert out.getvalue() == b''
+    with pytest.raises(serve.ServeError) as excinfo:
+        serve.request(serve.connect(path), layout+'.missing', BytesIO(DUMP), out)
+    assert 'No such file' in str(excinfo.value)
+
+def test_serve_concurrent(server):
+    # a request still being sent doesn't hold up other clients
+    layout, path = server
+    slow = serve.connect(path)
+    slow.sendall('hex text - - - {}\n'.format(layout).encode() + DUMP)
+    out = BytesIO()
+    serve.request(serve.connect(path), layout, BytesIO(DUMP), out, dump_format='md')
+    assert out.getvalue().startswith(b'80018640: 00000001')
+    slow.shutdown(socket.SHUT_WR)
+    while slow.recv(serve.BLOCK_SIZE):
+        pass
+    slow.close()
+
+def test_connect_missing():
+    assert serve.connect(os.path.join(tempfile.mkdtemp(), 'socket')) is None
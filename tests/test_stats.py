@@ -0,0 +1,36 @@
+from regulator.decode import Decoder
+from regulator.output import NullSink
+from regulator.parse import Parser
+from regulator.stats import Stats
+
+
+def test_stats(pytestconfig):
+    stats = Stats()
+    layout = str(pytestconfig.rootdir.join('layouts/imx6.yaml'))
+    decoder = Decoder(layout, sink=NullSink(), stats=stats)
+    parser = Parser(coalesce=True, sink=NullSink(), stats=stats)
+    lines = [
+        'mapping offset 0x02600000 (size 0x200000)',
+        '00000000: 00000761 00000000 00000000 00000000 a...............',
+        '00100000: 00000000 ................',
+    ]
+    for ms in parser.parse_lines(lines) + parser.flush():
+        decoder.decode(ms)
+    for ms in parser.parse_lines(lines[1:2]) + parser.flush():
+        decoder.decode(ms)
+
+    assert stats.counts == {
+        'lines': 4,
+        'slices': 3,
+        'registers': 4,
+        'fields': 26,
+        'unmatched': 1,
+    }
+    assert decoder.memo.hits == 2
+    summary = stats.summary().splitlines()
+    assert summary[0].startswith('regulator stats after ')
+    assert [line.split()[0] for line in summary[1:]] == [
+        'parse', 'lookup', 'extract', 'render',
+        'lines', 'slices', 'registers', 'fields', 'unmatched', 'memo',
+    ]
+    assert summary[-1] == '  memo       2 hits, 2 misses, 0 evictions'
@@ -0,0 +1,69 @@
+import os
+
+from regulator.tail import Tailer
+
+
+def test_tail_append(tmpdir):
+    log = tmpdir.join('log')
+    log.write('old\n')
+    t = Tailer(str(log))
+    assert t.check() == []
+
+    with log.open('a') as f:
+        f.write('line 1\nline')
+    assert t.check() == ['line 1']
+    with log.open('a') as f:
+        f.write(' 2\n')
+    assert t.check() == ['line 2']
+
+def test_tail_truncate(tmpdir):
+    log = tmpdir.join('log')
+    log.write('old line 1\nold line 2\n')
+    t = Tailer(str(log))
+    log.write('new\n')
+    assert t.check() == ['new']
+
+def test_tail_rotate(tmpdir):
+    log = tmpdir.join('log')
+    log.write('')
+    t = Tailer(str(log))
+    with log.open('a') as f:
+        f.write('line 1\n')
+    os.rename(str(log), str(tmpdir.join('log.1')))
+    assert t.check() == ['line 1']
+    assert t.check() == []
+    log.write('line 2\n')
+    assert t.check() == ['line 2']
+
+def test_tail_missing(tmpdir):
+    log = tmpdir.join('log')
+    t = Tailer(str(log))
+    assert t.check() == []
+    log.write('line 1\n')
+    assert t.check() == ['line 1']
+
+def test_tail_bounded(tmpdir):
+    log = tmpdir.join('log')
+    log.write('')
+    t = Tailer(str(log), chunk_size=4, batch_size=8, max_line=6)
+    with log.open('a') as f:
+        f.write('a very long line\nok\n')
+    lines = t.check()
+    assert t.more
+    while t.more:
+        lines += t.check()
+    assert lines == ['ok']
+
+def test_tail_follow(tmpdir):
+    log = tmpdir.join('log')
+    log.write('')
+    t = Tailer(str(log), interval=0.1)
+    batches = t.follow()
+    with log.open('a') as f:
+        f.write('line 1\nline 2\n')
+    lines = []
+    while not lines:
+        lines = next(batches)
+    assert lines == ['line 1', 'line 2']
+    batches.close()
+    assert t.file is None